@@ -1,22 +1,66 @@
 import os
 import re
+import time
+import codecs
 import sqlite3
+import gzip
 import hashlib
 import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from datetime import datetime, timezone, timedelta
+from typing import NamedTuple
 from zoneinfo import ZoneInfo
 from apscheduler.triggers.cron import CronTrigger
 
+import queue
 import random
 import uuid
+import atexit
+import functools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from jinja2 import Template
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram import Bot, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import RetryAfter
+
+# orjson в ~3 раза быстрее на больших ответах Epic/ITAD; без него — обычный json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    import json
+    json_loads = json.loads
+
+# ciso8601 (C) разбирает ISO-даты в ~10 раз быстрее и сам понимает "Z"
+try:
+    from ciso8601 import parse_datetime as iso_parse
+except ImportError:
+    def iso_parse(s: str) -> datetime:
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        return datetime.fromisoformat(s)
+
+# brotli для заранее сжатой главной; без него отдаём gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ijson (yajl2_c) — потоковый разбор больших ответов ITAD; опционален
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 # --------------------
@@ -29,6 +73,11 @@ ITAD_API_KEY = os.getenv("ITAD_API_KEY", "")
 
 DB_PATH = os.getenv("DB_PATH", "/opt/freerg/data/data.sqlite3")
 SITE_BASE = os.getenv("SITE_BASE", "https://freerg.store")
+STATIC_DIR = os.getenv("STATIC_DIR", "/opt/freerg/static")
+
+# ссылки /go: GO_URL_PREFIX + id + *_TAIL + utm_content (склейка без f-строк на каждую карточку)
+GO_URL_PREFIX = f"{SITE_BASE}/go/"
+GO_URL_TAIL = "?src=site&utm_campaign=freeredeemgames&utm_content="
 
 # расписания (аккуратно)
 STEAM_MIN = int(os.getenv("STEAM_MIN", "60"))     # Steam/ITAD раз в 60 минут
@@ -38,19 +87,60 @@ PRIME_MIN = int(os.getenv("PRIME_MIN", "1440"))
 
 # сколько максимум постов за 1 прогон (чтобы не залить канал)
 POST_LIMIT = int(os.getenv("POST_LIMIT", "10"))
+# сколько сообщений в TG отправляем одновременно (1 = строго по порядку)
+TG_SEND_CONCURRENCY = int(os.getenv("TG_SEND_CONCURRENCY", "5"))
+# сколько раз переотправляем пост, если Telegram ответил flood control (RetryAfter)
+TG_FLOOD_RETRIES = 3
+
+# общий HTTP-клиент: keep-alive + пул соединений к ITAD/Epic/Steam
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    # raise_on_status=False: когда повторы кончились, отдаём последний 5xx-ответ,
+    # а не RetryError — статус и тело ошибки разбирают сами вызывающие
+    max_retries=Retry(
+        total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+    ),
+))
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
 
 # tz для красивого дедлайна (Бишкек UTC+6)
 BISHKEK_TZ = ZoneInfo("Asia/Bishkek")
 
 EPIC_COUNTRY = os.getenv("EPIC_COUNTRY", "KG")   # попробуй KG
 EPIC_LOCALE  = os.getenv("EPIC_LOCALE", "ru-RU")
+DEBUG = os.getenv("DEBUG", "0") == "1"          # подробные логи парсеров
+
+# все HTML-шаблоны живут в одном Environment: компилируются один раз при импорте,
+# байткод кэшируется на диск и переживает рестарт процесса
+JINJA_SOURCES: dict[str, str] = {}
+JINJA_ENV = Environment(
+    loader=DictLoader(JINJA_SOURCES),
+    auto_reload=False,
+    cache_size=-1,
+    # названия/заметки приходят из ITAD/Epic и от пользователей LFG — экранируем
+    autoescape=True,
+    # autoescape меняет скомпилированный код, а ключ кэша — только исходник:
+    # своё имя файлов, чтобы не подхватить байткод без экранирования
+    bytecode_cache=FileSystemBytecodeCache(pattern="__jinja2_ae_%s.cache"),
+)
+
+
+def compile_template(name: str, source: str):
+    JINJA_SOURCES[name] = source
+    return JINJA_ENV.get_template(name)
+
 
 app = FastAPI()
 bot = Bot(token=TG_BOT_TOKEN) if TG_BOT_TOKEN else None
 
 scheduler = AsyncIOScheduler()
 _scheduler_started = False
-JOB_LOCK = asyncio.Lock()
+# по замку на магазин: Steam не ждёт, пока Epic разбирает свои ссылки;
+# одновременные записи в SQLite разводит WAL + BEGIN IMMEDIATE
+JOB_LOCKS: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
 
 
 
@@ -59,7 +149,6 @@ JOB_LOCK = asyncio.Lock()
 # ==========================================
 
 import hashlib
-import re
 
 # Хэш пароля админа (по умолчанию: "admin123")
 # Генерируй свой: echo -n "твой_пароль" | sha256sum
@@ -68,6 +157,24 @@ ADMIN_PASSWORD_HASH = os.getenv(
     "9f3fd4cc3c3d4d80c229578b00dec9c253494ed2370b20caa23b3cf4bc63b3ba"  # admin123
 )
 
+# паттерны антиспама компилируем один раз, а не на каждый текст
+LFG_LINK_RE = re.compile(
+    r'https?://'            # http://, https://
+    r'|www\.'               # www.
+    r'|\.(com|ru|org|net|io|gg|me|cc|tv|link)'  # домены
+    r'|t\.me'               # Telegram
+    r'|discord\.gg'         # Discord
+    r'|vk\.com'             # VK
+    r'|youtube\.com'        # YouTube
+    r'|twitch\.tv',         # Twitch
+    re.IGNORECASE,
+)
+LFG_PHONE_RE = re.compile(
+    r'\+\d{10,}'            # +79991234567
+    r'|8-?800'              # 8-800
+    r'|\d{3}[-\s]?\d{3}[-\s]?\d{2}[-\s]?\d{2}'  # 999-123-45-67
+)
+
 def validate_lfg_text(text: str) -> tuple[bool, str | None]:
     """
     Проверяет текст на спам/ссылки/контакты.
@@ -80,20 +187,8 @@ def validate_lfg_text(text: str) -> tuple[bool, str | None]:
     text_clean = text.replace(" ", "").replace("-", "")
     
     # 🔥 ЗАПРЕТ ССЫЛОК
-    link_patterns = [
-        r'https?://',           # http://, https://
-        r'www\.',               # www.
-        r'\.(com|ru|org|net|io|gg|me|cc|tv|link)',  # домены
-        r't\.me',               # Telegram
-        r'discord\.gg',         # Discord
-        r'vk\.com',             # VK
-        r'youtube\.com',        # YouTube
-        r'twitch\.tv',          # Twitch
-    ]
-    
-    for pattern in link_patterns:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            return False, "❌ Ссылки запрещены"
+    if LFG_LINK_RE.search(text_lower):
+        return False, "❌ Ссылки запрещены"
     
     # 🔥 ЗАПРЕТ EMAIL
     if '@' in text:
@@ -103,15 +198,8 @@ def validate_lfg_text(text: str) -> tuple[bool, str | None]:
                 return False, "❌ Email запрещены"
     
     # 🔥 ЗАПРЕТ ТЕЛЕФОНОВ
-    phone_patterns = [
-        r'\+\d{10,}',           # +79991234567
-        r'8-?800',              # 8-800
-        r'\d{3}[-\s]?\d{3}[-\s]?\d{2}[-\s]?\d{2}',  # 999-123-45-67
-    ]
-    
-    for pattern in phone_patterns:
-        if re.search(pattern, text_clean):
-            return False, "❌ Телефоны запрещены"
+    if LFG_PHONE_RE.search(text_clean):
+        return False, "❌ Телефоны запрещены"
     
     # 🔥 ЗАПРЕТ ПОДОЗРИТЕЛЬНЫХ СЛОВ (опционально)
     spam_words = ['casino', 'viagra', 'buy now', 'click here', 'free money']
@@ -161,26 +249,172 @@ def require_admin(request: Request):
 # --------------------
 # DB helpers
 # --------------------
+_DB_READY = False  # схема/WAL уже настроены в этом процессе
+# sqlite3 кэширует подготовленные запросы по тексту SQL на каждом соединении;
+# соединения живут весь процесс, так что держим кэш с запасом
+DB_STATEMENT_CACHE = 256
+
+# горячие мелкие запросы — константы, чтобы текст совпадал и план брался из кэша
+COUNT_DEALS_SQL = "SELECT n FROM deals_count"
+HOT_COUNT_SQL = "SELECT COUNT(*) FROM deals WHERE kind='hot_deal'"
+HOT_SAMPLE_SQL = "SELECT id, store, title, discount_pct FROM deals WHERE kind='hot_deal' LIMIT 5"
+
+
+# сколько свободных соединений держим про запас (отдельно пишущих и только-чтение);
+# лишние при возврате закрываются, так что в простое открыто не больше 2 * DB_POOL_SIZE
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Соединение из пула (см. db()). close() из обработчиков его не закрывает:
+    откатывает незакоммиченное и возвращает в очередь свободных, а если
+    очередь полна — закрывает по-настоящему.
+    """
+
+    pool: "queue.Queue[PooledConnection] | None" = None
+    checked_out = False
+
+    def close(self):
+        if not self.checked_out:  # повторный close() — соединение уже в пуле
+            return
+        self.checked_out = False
+        try:
+            if self.in_transaction:
+                self.rollback()
+            if self.pool is not None:
+                self.pool.put_nowait(self)
+                return
+        except (sqlite3.Error, queue.Full):
+            pass
+        super().close()
+
+    def close_for_real(self):
+        super().close()
+
+
+_DB_POOL: "queue.Queue[PooledConnection]" = queue.Queue(maxsize=DB_POOL_SIZE)
+_DB_RO_POOL: "queue.Queue[PooledConnection]" = queue.Queue(maxsize=DB_POOL_SIZE)
+
+
+@atexit.register
+def _close_db_conns():
+    for pool in (_DB_POOL, _DB_RO_POOL):
+        while True:
+            try:
+                conn = pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close_for_real()
+            except Exception:
+                pass
+
+
+def db_checkout(pool: "queue.Queue[PooledConnection]") -> PooledConnection | None:
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        return None
+    conn.checked_out = True
+    return conn
+
+
 def db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    """
+    Пишущее соединение из пула: открытие файла, PRAGMA и кэш prepared-statements
+    не повторяются на каждый запрос. Вызовы conn.close() в коде остаются как есть
+    (см. PooledConnection). Соединение, которое не вернули через close()
+    (исключение до него), просто закроется сборщиком мусора — в пул оно
+    не попадает и чужие запросы не отравляет. Для записей — with db_conn().
+
+    Это пишущее соединение; чистые чтения (статистика, /count, /debug_*)
+    идут через db_read(). Свободных соединений каждого вида в пуле не больше
+    DB_POOL_SIZE, занятых — столько, сколько запросов к БД идёт одновременно.
+    """
+    global _DB_READY
+
+    conn = db_checkout(_DB_POOL)
+    if conn is not None:
+        return conn
+
+    # Создаем папку, если её нет (на всякий случай)
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(
+        DB_PATH, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE,
+        factory=PooledConnection,
+    )
+    # ВОТ ЭТА СТРОКА ОЖИВИТ КЛИКИ И LFG:
     conn.row_factory = sqlite3.Row
+    tune_conn(conn)
+
+    # WAL хранится в самом файле БД, а схему достаточно проверить один раз
+    if not _DB_READY:
+        conn.execute("PRAGMA journal_mode=WAL;")
+
+        # порядок важен
+        ensure_tables(conn)        # таблицы
+        ensure_lfg_columns(conn)   # колонки
+        ensure_lfg_indexes(conn)   # индексы
+
+        conn.commit()
+        _DB_READY = True
+
+    conn.pool = _DB_POOL
+    conn.checked_out = True
+    return conn
+
+
+@contextmanager
+def db_conn():
+    """
+    with db_conn() as conn: — соединение возвращается в пул при любом исходе,
+    а при исключении (например, "database is locked") открытая транзакция
+    откатывается, и следующий BEGIN IMMEDIATE на нём не падает.
+    """
+    conn = db()
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    conn.execute("PRAGMA journal_mode=WAL;")
+
+def tune_conn(conn: sqlite3.Connection) -> None:
+    # эти PRAGMA действуют только на текущее соединение — ставим каждый раз
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA temp_store=MEMORY;")
     conn.execute("PRAGMA busy_timeout=5000;")
+    conn.execute("PRAGMA cache_size=-20000;")      # ~20MB
+    conn.execute("PRAGMA mmap_size=268435456;")    # 256MB
 
-    # порядок важен
-    ensure_tables(conn)        # таблицы
-    ensure_lfg_columns(conn)   # колонки
-    ensure_lfg_indexes(conn)   # индексы
 
-    # Создаем папку, если её нет (на всякий случай)
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    # ВОТ ЭТА СТРОКА ОЖИВИТ КЛИКИ И LFG:
+def db_read():
+    """
+    Соединение только для чтения (статистика, отладка).
+    isolation_level=None — без неявного BEGIN: каждый SELECT видит свежий
+    снимок WAL и не держит транзакцию между запросами.
+    """
+    conn = db_checkout(_DB_RO_POOL)
+    if conn is not None:
+        return conn
+
+    if not _DB_READY:
+        db().close()  # схема и WAL настраиваются пишущим соединением
+
+    conn = sqlite3.connect(
+        DB_PATH, check_same_thread=False, isolation_level=None,
+        cached_statements=DB_STATEMENT_CACHE, factory=PooledConnection,
+    )
     conn.row_factory = sqlite3.Row
+    tune_conn(conn)
+    conn.execute("PRAGMA query_only=ON;")
 
+    conn.pool = _DB_RO_POOL
+    conn.checked_out = True
     return conn
 
 def ensure_tables(conn: sqlite3.Connection) -> None:
@@ -209,8 +443,34 @@ def ensure_tables(conn: sqlite3.Connection) -> None:
     # Индексы для deals
     conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_posted ON deals(posted);")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_store ON deals(store);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_kind ON deals(kind);")
+    # витрина: kind=? ORDER BY created_at DESC LIMIT 150 идёт по индексу без сортировки;
+    # старый idx_deals_kind — его префикс, он больше не нужен
+    conn.execute("DROP INDEX IF EXISTS idx_deals_kind;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_kind_created ON deals(kind, created_at);")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_created ON deals(created_at);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_store_url ON deals(store, url);")
+    # очередь на постинг в TG (частичный индекс: только неотправленные)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_pending ON deals(store, kind, created_at) WHERE posted=0;")
+    # id горячих скидок по корзинам — покрывающий индекс, таблицу не читаем
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_hot ON deals(kind, discount_pct, id);")
+    # все фильтры по сроку идут через julianday(ends_at) — индекс по выражению
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deals_ends_jd ON deals(julianday(ends_at));")
+
+    # COUNT(*) по deals — всегда полный проход; /count читает счётчик из триггеров
+    conn.execute("CREATE TABLE IF NOT EXISTS deals_count (n INTEGER NOT NULL);")
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_deals_count_ins'"
+    ).fetchone():
+        conn.execute("""
+          CREATE TRIGGER trg_deals_count_ins AFTER INSERT ON deals
+          BEGIN UPDATE deals_count SET n = n + 1; END;
+        """)
+        conn.execute("""
+          CREATE TRIGGER trg_deals_count_del AFTER DELETE ON deals
+          BEGIN UPDATE deals_count SET n = n - 1; END;
+        """)
+        conn.execute("DELETE FROM deals_count;")
+        conn.execute("INSERT INTO deals_count(n) SELECT COUNT(*) FROM deals;")
 
     # clicks
     conn.execute("""
@@ -227,7 +487,15 @@ def ensure_tables(conn: sqlite3.Connection) -> None:
       );
     """)
     conn.execute("CREATE INDEX IF NOT EXISTS idx_clicks_deal_id ON clicks(deal_id);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_clicks_created ON clicks(created_at);")
+    # покрывающие индексы под статистику: диапазон по created_at + группировка
+    # по deal_id/src без чтения самой таблицы; старый idx_clicks_created
+    # полностью покрывается первым из них
+    conn.execute("DROP INDEX IF EXISTS idx_clicks_created;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clicks_created_deal_src ON clicks(created_at, deal_id, src);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clicks_src_created ON clicks(src, created_at);")
+
+    # итоги по дням / по (день, сделка, источник) — см. CLICK_ROLLUPS
+    ensure_click_rollups(conn)
 
     # free_games
     conn.execute("""
@@ -286,10 +554,102 @@ def ensure_tables(conn: sqlite3.Connection) -> None:
     """)
     conn.execute("CREATE INDEX IF NOT EXISTS idx_manual_news_created ON manual_news(created_at);")
 
+    # кэш обложек Steam по appid (чтобы не парсить страницу каждый прогон)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS steam_images (
+        app_id TEXT PRIMARY KEY,
+        header TEXT,
+        capsule TEXT,
+        hero TEXT,
+        library TEXT,
+        checked_at INTEGER         -- unix time
+    );
+    """)
+
+    # куда ведёт itad.link (itad.link -> страница Steam не меняется)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS itad_redirects (
+        url TEXT PRIMARY KEY,
+        final_url TEXT NOT NULL,
+        checked_at INTEGER         -- unix time
+    );
+    """)
+
     conn.commit()
 
 import sqlite3
 
+# Итоги кликов, которые ведут триггеры на clicks: /stats читает их
+# вместо группировки сырых кликов. (таблица, DDL, триггер, бэкфилл)
+# WITHOUT ROWID — строки лежат прямо в B-дереве первичного ключа (day, ...),
+# поэтому выборка "day >= ?" читает подряд идущие страницы вместе с cnt.
+CLICK_ROLLUPS = [
+    (
+        "clicks_daily",
+        """
+          CREATE TABLE IF NOT EXISTS clicks_daily (
+            day TEXT PRIMARY KEY,
+            cnt INTEGER NOT NULL DEFAULT 0
+          ) WITHOUT ROWID;
+        """,
+        """
+          CREATE TRIGGER trg_clicks_daily AFTER INSERT ON clicks
+          BEGIN
+            INSERT INTO clicks_daily(day, cnt) VALUES (substr(NEW.created_at, 1, 10), 1)
+            ON CONFLICT(day) DO UPDATE SET cnt = cnt + 1;
+          END;
+        """,
+        """
+          INSERT INTO clicks_daily(day, cnt)
+          SELECT substr(created_at, 1, 10), COUNT(*)
+          FROM clicks
+          WHERE created_at IS NOT NULL
+          GROUP BY 1
+        """,
+    ),
+    (
+        "clicks_by_deal_day",
+        """
+          CREATE TABLE IF NOT EXISTS clicks_by_deal_day (
+            day TEXT NOT NULL,
+            deal_id TEXT NOT NULL,
+            src TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, deal_id, src)
+          ) WITHOUT ROWID;
+        """,
+        """
+          CREATE TRIGGER trg_clicks_by_deal_day AFTER INSERT ON clicks
+          BEGIN
+            INSERT INTO clicks_by_deal_day(day, deal_id, src, cnt)
+            VALUES (substr(NEW.created_at, 1, 10), COALESCE(NEW.deal_id, ''), COALESCE(NEW.src, ''), 1)
+            ON CONFLICT(day, deal_id, src) DO UPDATE SET cnt = cnt + 1;
+          END;
+        """,
+        """
+          INSERT INTO clicks_by_deal_day(day, deal_id, src, cnt)
+          SELECT substr(created_at, 1, 10), COALESCE(deal_id, ''), COALESCE(src, ''), COUNT(*)
+          FROM clicks
+          WHERE created_at IS NOT NULL
+          GROUP BY 1, 2, 3
+        """,
+    ),
+]
+
+
+def ensure_click_rollups(conn: sqlite3.Connection) -> None:
+    for table, ddl, trigger, backfill in CLICK_ROLLUPS:
+        conn.execute(ddl)
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?", (f"trg_{table}",)
+        ).fetchone():
+            continue
+        conn.execute(trigger)
+        # разовый бэкфилл из уже накопленных кликов (в той же транзакции, что и триггер)
+        conn.execute(f"DELETE FROM {table};")
+        conn.execute(backfill)
+
+
 def table_exists(conn: sqlite3.Connection, name: str) -> bool:
     row = conn.execute(
         "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1;",
@@ -326,6 +686,8 @@ def ensure_columns() -> None:
     add_column_if_missing(conn, "deals", "price_old", "REAL")
     add_column_if_missing(conn, "deals", "price_new", "REAL")
     add_column_if_missing(conn, "deals", "currency", "TEXT")
+    add_column_if_missing(conn, "deals", "is_new", "INTEGER DEFAULT 0")
+    add_column_if_missing(conn, "deals", "is_expired_recent", "INTEGER DEFAULT 0")
     
     conn.commit()
     conn.close()
@@ -360,18 +722,50 @@ def backfill_defaults():
     """
     Чтобы старые записи (до миграции) не пропали при фильтрации.
     """
-    conn = db()
-    conn.execute("UPDATE deals SET store='steam' WHERE store IS NULL OR store=''")
-    conn.execute("UPDATE deals SET kind='free_to_keep' WHERE kind IS NULL OR kind=''")
-    conn.commit()
-    conn.close()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # один проход по таблице на оба поля
+        cur = conn.execute("""
+            UPDATE deals SET
+              store = COALESCE(NULLIF(store, ''), 'steam'),
+              kind = COALESCE(NULLIF(kind, ''), 'free_to_keep')
+            WHERE store IS NULL OR store='' OR kind IS NULL OR kind=''
+        """)
+        conn.commit()
+    if cur.rowcount:
+        invalidate_page_cache()
+
+
+def refresh_deal_flags(new_hours: int = 24, expired_days: int = 7) -> int:
+    """
+    Пересчитываем флаги is_new / is_expired_recent одним UPDATE,
+    чтобы index() не парсил даты на каждой строке.
+    Границы те же, что у is_new() и is_expired_recent().
+    Возвращает количество обновлённых строк.
+    """
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute("""
+            UPDATE deals SET
+              is_new = COALESCE(julianday(created_at) >= julianday('now', ?), 0),
+              is_expired_recent = COALESCE(
+                julianday(ends_at) <= julianday('now')
+                AND julianday(ends_at) >= julianday('now', ?), 0)
+        """, (f"-{new_hours} hours", f"-{expired_days} days"))
+        conn.commit()
+    invalidate_page_cache()
+    return cur.rowcount
 
 
 def deal_id(store: str, external_id: str, url: str) -> str:
+    # blake2b сразу отдаёт 12 байт = 24 hex (как раньше sha256()[:24]), без обрезки.
+    # ⚠️ id новых записей отличаются от старых sha256-id, поэтому дубли
+    # в save_deals ловим ещё и по (store, url) — старые ссылки /go/<id> живут.
     base = f"{store}|{url}"
-    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:24]
+    return hashlib.blake2b(base.encode("utf-8"), digest_size=12).hexdigest()
 
 
+@functools.lru_cache(maxsize=2048)  # результат зависит только от строки — можно кэшировать
 def format_expiry(expiry_iso: str | None) -> str:
     if not expiry_iso:
         return "ограниченно (проверь в магазине)"
@@ -389,27 +783,41 @@ def format_expiry(expiry_iso: str | None) -> str:
 def parse_iso_utc(s: str | None) -> datetime | None:
     if not s:
         return None
-    t = s.strip()
-    if t.endswith("Z"):
-        t = t[:-1] + "+00:00"
     try:
-        return datetime.fromisoformat(t)
-    except Exception:
+        return iso_parse(s.strip())
+    except (ValueError, TypeError):
         return None
 
 
-def is_new(created_at: str | None, hours: int = 24) -> bool:
-    dt = parse_iso_utc(created_at)
+@functools.lru_cache(maxsize=1024)
+def parse_iso_utc_cached(s: str | None) -> datetime | None:
+    """
+    parse_iso_utc с кэшем: у раздач Epic одни и те же окна startDate/endDate.
+    datetime неизменяемый, так что отдавать один объект безопасно.
+    """
+    return parse_iso_utc(s)
+
+
+def as_utc_dt(v: str | datetime | None) -> datetime | None:
+    """Строка из БД или уже разобранный datetime — хелперам ниже годится и то, и то."""
+    if isinstance(v, datetime):
+        return v
+    return parse_iso_utc_cached(v)
+
+
+def is_new(created_at: str | datetime | None, hours: int = 24, now: datetime | None = None) -> bool:
+    dt = as_utc_dt(created_at)
     if not dt:
         return False
-    return dt >= (datetime.now(timezone.utc) - timedelta(hours=hours))
+    now = now or datetime.now(timezone.utc)
+    return dt >= (now - timedelta(hours=hours))
 
 
-def time_left_label(ends_at: str | None) -> str | None:
-    dt = parse_iso_utc(ends_at)
+def time_left_label(ends_at: str | datetime | None, now: datetime | None = None) -> str | None:
+    dt = as_utc_dt(ends_at)
     if not dt:
         return None
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     delta = dt - now
     if delta.total_seconds() <= 0:
         return "истекло"
@@ -425,24 +833,18 @@ def time_left_label(ends_at: str | None) -> str | None:
     return f"осталось {mins} мин"
 
 
-def sort_key_by_ends(ends_at: str | None):
-    dt = parse_iso_utc(ends_at)
-    # None/битые — в конец
-    return dt if dt else datetime.max.replace(tzinfo=timezone.utc)
-
-
-def is_active_end(ends_at: str | None) -> bool:
-    dt = parse_iso_utc(ends_at)
+def is_active_end(ends_at: str | datetime | None, now: datetime | None = None) -> bool:
+    dt = as_utc_dt(ends_at)
     if not dt:
         return True  # если дедлайна нет — считаем актуальным
-    return dt > datetime.now(timezone.utc)
+    return dt > (now or datetime.now(timezone.utc))
 
 
-def is_expired_recent(ends_at: str | None, days: int = 7) -> bool:
-    dt = parse_iso_utc(ends_at)
+def is_expired_recent(ends_at: str | datetime | None, days: int = 7, now: datetime | None = None) -> bool:
+    dt = as_utc_dt(ends_at)
     if not dt:
         return False
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     return (dt <= now) and (dt >= now - timedelta(days=days))
 
 
@@ -451,35 +853,21 @@ def cleanup_expired(keep_days: int = 7) -> int:
     Удаляем записи, у которых ends_at прошло больше, чем keep_days назад.
     keep_days=7 => неделю храним, потом чистим.
     Возвращает количество удалённых.
-    """
-    cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
-
-    conn = db()
-    rows = conn.execute(
-        "SELECT id, ends_at FROM deals WHERE ends_at IS NOT NULL AND ends_at != ''"
-    ).fetchall()
-
-    to_delete = []
-    for did, ends_at in rows:
-        s = (ends_at or "").strip()
-        if not s:
-            continue
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        try:
-            dt = datetime.fromisoformat(s)
-            if dt < cutoff:
-                to_delete.append((did,))
-        except Exception:
-            # если формат даты кривой — не трогаем
-            pass
 
-    if to_delete:
-        conn.executemany("DELETE FROM deals WHERE id=?", to_delete)
+    Сравнение делает SQLite: julianday() понимает и "Z", и "+00:00",
+    а на кривой дате даёт NULL — такие строки не трогаем, как и раньше.
+    """
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(
+            "DELETE FROM deals WHERE julianday(ends_at) < julianday('now', ?)",
+            (f"-{keep_days} days",),
+        )
+        deleted = cur.rowcount
         conn.commit()
-
-    conn.close()
-    return len(to_delete)
+    if deleted:
+        invalidate_page_cache()
+    return deleted
 
 import secrets
 from fastapi import Response
@@ -503,28 +891,76 @@ def log_click(
     visitor_id: str | None = None
 ):
     try:
-        ip = request.client.host if request.client else None
-        ua = request.headers.get("user-agent")
-        ref = request.headers.get("referer")
-
-        conn.execute("""
-            INSERT INTO clicks (created_at, deal_id, src, utm_campaign, utm_content, ip, user_agent, referer, visitor_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.utcnow().isoformat(),
-            deal_id,
-            src,
-            utm_campaign,
-            utm_content,
-            ip,
-            ua,
-            ref,
-            visitor_id
-        ))
+        conn.execute(CLICK_INSERT_SQL, click_row(deal_id, request, src, utm_campaign, utm_content, visitor_id))
         conn.commit()
     except Exception:
         pass
 
+
+CLICK_INSERT_SQL = """
+    INSERT INTO clicks (created_at, deal_id, src, utm_campaign, utm_content, ip, user_agent, referer, visitor_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def click_row(
+    deal_id: str,
+    request: Request,
+    src: str | None = None,
+    utm_campaign: str | None = None,
+    utm_content: str | None = None,
+    visitor_id: str | None = None
+) -> tuple:
+    return (
+        datetime.utcnow().isoformat(),
+        deal_id,
+        src,
+        utm_campaign,
+        utm_content,
+        request.client.host if request.client else None,
+        request.headers.get("user-agent"),
+        request.headers.get("referer"),
+        visitor_id,
+    )
+
+
+# клики с /go пишем не в запросе, а пачками: редирект не ждёт диска,
+# N кликов -> одна транзакция
+CLICK_QUEUE: asyncio.Queue = asyncio.Queue()
+CLICK_BATCH = 100
+CLICK_FLUSH_SEC = 0.5
+_click_writer_task: asyncio.Task | None = None
+
+
+def write_clicks(rows: list[tuple]) -> None:
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(CLICK_INSERT_SQL, rows)
+        conn.commit()
+
+
+async def click_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await CLICK_QUEUE.get()]
+        deadline = loop.time() + CLICK_FLUSH_SEC
+        try:
+            while len(batch) < CLICK_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(CLICK_QUEUE.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            write_clicks(batch)  # shutdown: уже вынутое из очереди не теряем
+            raise
+        try:
+            await asyncio.to_thread(write_clicks, batch)
+        except Exception as e:
+            print("CLICK WRITER ERROR:", repr(e))
+
 import secrets
 
 VOTE_COOKIE_NAME = "frg_vid"  # visitor id
@@ -650,27 +1086,29 @@ def clamp_text(s: str | None, max_len: int) -> str:
 # --------------------
 # Steam image helpers
 # --------------------
+STEAM_APP_ID_RE = re.compile(r'/app/(\d+)')
+STEAM_APPID_QS_RE = re.compile(r'[?&]appid=(\d+)')
+STEAM_HEADER_JSON_RE = re.compile(r'"header_image":"([^"]+)"')
+
+
+@functools.lru_cache(maxsize=8192)  # одни и те же URL на каждом рендере главной
 def extract_steam_app_id_fast(url: str) -> str | None:
     """Извлекает app_id ЛЮБЫМ способом"""
     if not url:
         return None
     
-    import re
-    
     # 1. Прямой Steam URL: /app/123456
-    match = re.search(r'/app/(\d+)', url)
-    if match:
-        return match.group(1)
-    
-    # 2. Из image_url если он есть в кэше или параметрах
-    # Пример: если URL содержит ?appid=123456
-    match = re.search(r'[?&]appid=(\d+)', url)
-    if match:
-        return match.group(1)
+    # (сначала дешёвая проверка подстроки — для Epic/GOG/Prime/itad.link регэксп не запускаем)
+    if "/app/" in url:
+        match = STEAM_APP_ID_RE.search(url)
+        if match:
+            return match.group(1)
     
-    # 3. 🔥 ВАЖНО: Из image_url который УЖЕ в БД!
-    # Вам нужно передать image_url в extract_steam_app_id_fast
-    # ИЛИ изменить логику
+    # 2. Из параметров, если URL содержит ?appid=123456
+    if "appid=" in url:
+        match = STEAM_APPID_QS_RE.search(url)
+        if match:
+            return match.group(1)
     
     return None
 
@@ -687,7 +1125,7 @@ def get_real_steam_app_id(url: str) -> str | None:
     
     # Если это itad.link или другой редирект - делаем запрос
     try:
-        resp = requests.head(url, timeout=5, allow_redirects=True)
+        resp = SESSION.head(url, timeout=5, allow_redirects=True)
         final_url = str(resp.url)
         
         # Извлекаем AppID из конечного URL
@@ -732,6 +1170,19 @@ def steam_header_candidates(app_id: str) -> list[str]:
     return candidates
 
 
+def resolve_redirects(url: str, timeout: float = 10):
+    """
+    Идём по редиректам ради конечного resp.url / статуса — тело страницы не нужно.
+    HEAD; на любой ответ >= 400 — GET со stream=True и сразу close(): кроме
+    405/501, магазины за антибот-защитой отвечают на HEAD 403/404, а GET проходит.
+    """
+    resp = SESSION.head(url, timeout=timeout, allow_redirects=True)
+    if resp.status_code >= 400:
+        resp = SESSION.get(url, timeout=timeout, allow_redirects=True, stream=True)
+        resp.close()
+    return resp
+
+
 def resolve_steam_app_id(url: str) -> str | None:
     """
     Добывает appid:
@@ -744,7 +1195,7 @@ def resolve_steam_app_id(url: str) -> str | None:
         return app_id
 
     try:
-        resp = requests.get(url, timeout=10, allow_redirects=True, headers={"User-Agent":"Mozilla/5.0"})
+        resp = resolve_redirects(url, timeout=10)
         final_url = str(resp.url)
         return extract_steam_app_id_fast(final_url)
     except Exception:
@@ -757,7 +1208,7 @@ def resolve_steam_app_id_limited(url: str, allow_slow: bool = True) -> str | Non
     if not allow_slow:
         return None
     try:
-        resp = requests.get(url, timeout=10, allow_redirects=True, headers={"User-Agent":"Mozilla/5.0"})
+        resp = resolve_redirects(url, timeout=10)
         return extract_steam_app_id_fast(str(resp.url))
     except Exception:
         return None
@@ -768,12 +1219,48 @@ def resolve_steam_app_id_slow(url: str) -> str | None:
     Использовать ТОЛЬКО в update job (fetch_*), НЕ в рендере.
     """
     try:
-        resp = requests.get(url, timeout=10, allow_redirects=True, headers={"User-Agent": "Mozilla/5.0"})
+        resp = resolve_redirects(url, timeout=10)
         return extract_steam_app_id_fast(str(resp.url))
     except Exception:
         return None
 
 
+STEAM_PAGE_CHUNK = 64 * 1024
+STEAM_PAGE_MAX_BYTES = 1024 * 1024  # больше страницы Steam не бывают, это защита
+
+
+def read_steam_page(resp, app_id: str) -> str:
+    """
+    Читаем страницу Steam кусками (resp должен быть с stream=True).
+    Обложки обычно лежат в первых ~50KB, поэтому останавливаемся,
+    как только нашли все 4 (header/capsule/hero/library) или упёрлись в лимит.
+    """
+    targets = [
+        re.compile(rf'steam/apps/{app_id}/(?:[a-f0-9]{{30,50}}/)?{name}\.jpg')
+        for name in ("header", "capsule_616x353", "hero_capsule", "library_600x900")
+    ]
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts: list[str] = []
+    size = 0
+
+    try:
+        for chunk in resp.iter_content(STEAM_PAGE_CHUNK):
+            if not chunk:
+                continue
+            size += len(chunk)
+            parts.append(decoder.decode(chunk))
+
+            html = "".join(parts)
+            targets = [t for t in targets if not t.search(html)]
+            if not targets or size >= STEAM_PAGE_MAX_BYTES:
+                break
+        parts.append(decoder.decode(b"", final=True))
+    finally:
+        resp.close()
+
+    return "".join(parts)
+
+
 def get_steam_images_from_page(app_id: str, url: str = None) -> dict:
     """
     УНИВЕРСАЛЬНАЯ функция для получения изображений Steam.
@@ -791,19 +1278,22 @@ def get_steam_images_from_page(app_id: str, url: str = None) -> dict:
             'Cookie': 'birthtime=0; mature_content=1; wants_mature_content=1; lastagecheckage=1-0-1990',
         }
         
-        resp = requests.get(page_url, headers=headers, timeout=15, allow_redirects=True)
+        resp = SESSION.get(page_url, headers=headers, timeout=15, allow_redirects=True, stream=True)
         
         if resp.status_code != 200:
+            resp.close()
             return {}
         
-        html = resp.text
+        html = read_steam_page(resp, app_id)
         
         # Если попали на agecheck — редирект с параметром
         if '/agecheck/' in resp.url or 'agecheck' in html.lower():
             age_url = f"https://store.steampowered.com/app/{app_id}/?ageDay=1&ageMonth=1&ageYear=1990"
-            resp2 = requests.get(age_url, headers=headers, timeout=15)
+            resp2 = SESSION.get(age_url, headers=headers, timeout=15, stream=True)
             if resp2.status_code == 200:
-                html = resp2.text
+                html = read_steam_page(resp2, app_id)
+            else:
+                resp2.close()
         
         result = {
             'header': None,
@@ -876,8 +1366,7 @@ def get_steam_images_from_page(app_id: str, url: str = None) -> dict:
                 result['all'].append(matches[0])
         
         # 🔥 3. JSON данные в HTML (часто там есть изображения)
-        pattern_json = r'"header_image":"([^"]+)"'
-        matches = re.findall(pattern_json, html)
+        matches = STEAM_HEADER_JSON_RE.findall(html)
         for img_url in matches:
             if img_url and img_url not in result['all']:
                 result['all'].append(img_url)
@@ -895,7 +1384,7 @@ def get_steam_images_from_page(app_id: str, url: str = None) -> dict:
             
             for standard_url in standard_urls:
                 try:
-                    resp_test = requests.head(standard_url, timeout=2)
+                    resp_test = SESSION.head(standard_url, timeout=2)
                     if resp_test.status_code == 200:
                         result['all'].append(standard_url)
                         if not result['header'] and 'header.jpg' in standard_url:
@@ -918,7 +1407,9 @@ def get_steam_images_from_page(app_id: str, url: str = None) -> dict:
         return {}
 
 
+@functools.lru_cache(maxsize=4096)
 def steam_header_image_from_url(url: str) -> str | None:
+    # чистая функция от url (без сети), поэтому кэшируем
     app_id = extract_steam_app_id_fast(url)
     if not app_id:
         return None
@@ -937,12 +1428,72 @@ def steam_header_cdn_from_url(url: str) -> str | None:
     """
     if not url:
         return None
-    m = re.search(r"/app/(\d+)", url)
+    m = STEAM_APP_ID_RE.search(url)
     if not m:
         return None
     appid = m.group(1)
     return f"https://cdn.akamai.steamstatic.com/steam/apps/{appid}/header.jpg"
 
+STEAM_IMAGES_TTL = 30 * 24 * 3600  # 30 дней
+
+
+def steam_images_cached_get(app_id: str) -> dict | None:
+    """
+    Достаём обложки из таблицы steam_images, если запись моложе STEAM_IMAGES_TTL.
+    """
+    if not app_id:
+        return None
+    conn = db()
+    row = conn.execute(
+        "SELECT header, capsule, hero, library, checked_at FROM steam_images WHERE app_id=?",
+        (app_id,),
+    ).fetchone()
+    conn.close()
+
+    if not row or (int(time.time()) - int(row[4] or 0)) >= STEAM_IMAGES_TTL:
+        return None
+
+    header, capsule, hero, library, _ = row
+    result = {"header": header, "capsule": capsule, "hero": hero, "library": library}
+    result["all"] = [u for u in result.values() if u]
+    return result
+
+
+def steam_images_cached(app_id: str, url: str = None) -> dict:
+    """
+    То же, что get_steam_images_from_page, но сначала смотрим в кэш steam_images.
+    Steam дёргаем только если записи нет или она старше 30 дней.
+    """
+    if not app_id:
+        return {}
+
+    cached = steam_images_cached_get(app_id)
+    if cached is not None:
+        return cached
+
+    images = get_steam_images_from_page(app_id, url)
+
+    # пустой результат (ошибка сети/агечек) не кэшируем — попробуем в след. раз
+    if images and any(images.get(k) for k in ("header", "capsule", "hero", "library")):
+        conn = db()
+        conn.execute(
+            "INSERT OR REPLACE INTO steam_images (app_id, header, capsule, hero, library, checked_at) "
+            "VALUES (?,?,?,?,?,?)",
+            (
+                app_id,
+                images.get("header"),
+                images.get("capsule"),
+                images.get("hero"),
+                images.get("library"),
+                int(time.time()),
+            ),
+        )
+        conn.commit()
+        conn.close()
+
+    return images
+
+
 def validate_steam_app_id(app_id: str) -> bool:
     """
     Проверяет, является ли AppID валидным для Steam.
@@ -950,6 +1501,11 @@ def validate_steam_app_id(app_id: str) -> bool:
     """
     if not app_id or not app_id.isdigit():
         return False
+
+    # если обложка уже есть в кэше — appid точно живой, HEAD не нужен
+    cached = steam_images_cached_get(app_id)
+    if cached and cached.get("all"):
+        return True
     
     # Пробуем несколько типов изображений
     test_urls = [
@@ -960,7 +1516,7 @@ def validate_steam_app_id(app_id: str) -> bool:
     
     for test_url in test_urls:
         try:
-            resp = requests.head(test_url, timeout=3, allow_redirects=True)
+            resp = SESSION.head(test_url, timeout=3, allow_redirects=True)
             if resp.status_code == 200:
                 content_type = resp.headers.get('Content-Type', '')
                 if 'image' in content_type or 'jpeg' in content_type:
@@ -974,26 +1530,30 @@ def validate_steam_app_id(app_id: str) -> bool:
 # --------------------
 # SOURCES: ITAD (Prime)
 # --------------------
+PRIME_LINK_RE = re.compile(r'href="(https://primegaming\.blog/[^"]*-[^"]*)"')
+
+
 def fetch_prime_blog():
     """
     Берём последние статьи Prime Gaming Blog по тегу "free-games-with-prime"
     и добавляем как записи (дайджест).
     """
     url = "https://primegaming.blog/tagged/free-games-with-prime"
-    r = requests.get(url, timeout=25, headers={"User-Agent": "Mozilla/5.0"})
+    r = SESSION.get(url, timeout=25)
     r.raise_for_status()
     html = r.text
 
     # очень простой парсинг ссылок на статьи (Medium-подобная разметка часто меняется)
     # но работает как старт. Если захочешь — улучшим до BeautifulSoup.
+    # finditer идёт по документу лениво и останавливается на 5-й ссылке —
+    # без нарезки всей страницы на список кусков
     links = []
-    for part in html.split('href="'):
-        if part.startswith("https://primegaming.blog/") and "-" in part:
-            link = part.split('"', 1)[0]
-            if link not in links:
-                links.append(link)
-        if len(links) >= 5:
-            break
+    for m in PRIME_LINK_RE.finditer(html):
+        link = m.group(1)
+        if link not in links:
+            links.append(link)
+            if len(links) >= 5:
+                break
 
     out = []
     for link in links:
@@ -1012,6 +1572,75 @@ def fetch_prime_blog():
     return out
 
 
+# --------------------
+# SOURCES: ITAD (общие хелперы)
+# --------------------
+def itad_free_items(items):
+    """
+    Генератор (it, deal) только по бесплатным раздачам из ответа ITAD deals/v2.
+    Дешёвый фильтр (cut==100 или цена 0) идёт первым, остальные поля
+    вызывающий код читает уже только для подходящих записей.
+    """
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+
+        deal = it.get("deal")
+        if not isinstance(deal, dict):
+            deal = it
+
+        # free-to-keep: 100% или цена 0
+        if deal.get("cut") == 100:
+            yield it, deal
+            continue
+        price_obj = deal.get("price")
+        if isinstance(price_obj, dict) and price_obj.get("amount") == 0:
+            yield it, deal
+
+
+# те же формы ответа, что понимает разбор без ijson: голый список
+# или {"list"|"data"|"items"|"result": [...]}
+ITAD_ITEM_PREFIXES = frozenset({"item", "list.item", "data.item", "items.item", "result.item"})
+
+
+def itad_stream_items(r):
+    """
+    Итератор по элементам ответа ITAD deals/v2 (формы — ITAD_ITEM_PREFIXES).
+    С ijson разбираем r.raw по мере чтения (ответ запрошен с stream=True),
+    без него — как раньше, целиком через json_loads.
+    """
+    if ijson is not None:
+        r.raw.decode_content = True  # gzip снимает urllib3
+        # элементы собираем сами по событиям parse: так ловятся все формы из
+        # ITAD_ITEM_PREFIXES, а не только "list.item".
+        # use_float: иначе цены придут Decimal, а sqlite их не биндит
+        builder = None
+        depth = 0
+        for prefix, event, value in ijson.parse(r.raw, use_float=True):
+            if builder is None:
+                if prefix not in ITAD_ITEM_PREFIXES or event in ("map_key", "end_map", "end_array"):
+                    continue
+                if event not in ("start_map", "start_array"):
+                    yield value  # скаляр прямо в массиве
+                    continue
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+                if depth == 0:
+                    yield builder.value
+                    builder = None
+        return
+
+    data = json_loads(r.content)
+    items = data if isinstance(data, list) else (
+        data.get("list") or data.get("data") or data.get("items") or data.get("result") or []
+    )
+    yield from items
+
+
 # --------------------
 # SOURCES: ITAD (GOG)
 # --------------------
@@ -1031,9 +1660,9 @@ def fetch_itad_gog():
         "sort": "-cut",
     }
 
-    r = requests.get(endpoint, params=params, timeout=25)
+    r = SESSION.get(endpoint, params=params, timeout=25)
     r.raise_for_status()
-    data = r.json()
+    data = json_loads(r.content)
 
     if isinstance(data, list):
         items = data
@@ -1041,19 +1670,7 @@ def fetch_itad_gog():
         items = data.get("list") or data.get("data") or data.get("items") or data.get("result") or []
 
     out = []
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-
-        deal = it.get("deal") if isinstance(it.get("deal"), dict) else it
-        cut = deal.get("cut")
-        price_obj = deal.get("price") or {}
-        price_amount = price_obj.get("amount") if isinstance(price_obj, dict) else None
-
-        # free-to-keep: 100% или цена 0
-        if not (cut == 100 or price_amount == 0):
-            continue
-
+    for it, deal in itad_free_items(items):
         title = it.get("title") or it.get("name") or deal.get("title") or deal.get("name") or "GOG giveaway"
         url = deal.get("url") or it.get("url")
         if not url:
@@ -1096,35 +1713,22 @@ def fetch_itad_steam(limit: int = 200, slow_limit: int = 20):
         "sort": "-cut",
     }
 
-    r = requests.get(endpoint, params=params, timeout=25)
+    r = SESSION.get(endpoint, params=params, timeout=25)
     print("ITAD URL:", r.url)
     print("ITAD STATUS:", r.status_code)
     if r.status_code >= 400:
-      print("ITAD ERROR BODY:", (r.text or "")[:800])
-    r.raise_for_status()
-    data = r.json()
+        # 800 байт руками: r.text декодировал бы всё тело (и гонял chardet)
+        print("ITAD ERROR BODY:", r.content[:800].decode("utf-8", "replace"))
+        r.raise_for_status()
+    data = json_loads(r.content)
 
     items = data if isinstance(data, list) else (
         data.get("list") or data.get("data") or data.get("items") or data.get("result") or []
     )
 
+    # 1) быстрый этап: только разбор ответа ITAD, без сети
     out: list[dict] = []
-    scrape_left = 10  # парсинг страниц для изображений
-
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-
-        deal = it.get("deal") if isinstance(it.get("deal"), dict) else it
-
-        cut = deal.get("cut")
-        price_obj = deal.get("price") or {}
-        price_amount = price_obj.get("amount") if isinstance(price_obj, dict) else None
-
-        # free-to-keep: 100% или цена 0
-        if not (cut == 100 or price_amount == 0):
-            continue
-
+    for it, deal in itad_free_items(items):
         title = (
             it.get("title") or it.get("name")
             or deal.get("title") or deal.get("name")
@@ -1135,71 +1739,139 @@ def fetch_itad_steam(limit: int = 200, slow_limit: int = 20):
         if not itad_url:
             continue
 
-        # 🔥 ВАЖНО: Получаем конечный Steam URL вместо itad.link
-        steam_url = itad_url
-        app_id = None
-
-        try:
-            if "itad.link" in itad_url:
-                # Делаем GET запрос с редиректами
-                resp = requests.get(itad_url, timeout=8, allow_redirects=True, headers={"User-Agent": "Mozilla/5.0"})
-                steam_url = str(resp.url)
-                print(f"  🔄 Редирект: {itad_url[:50]}... -> {steam_url[:60]}...")
-        
-                # Извлекаем AppID
-                app_id = extract_steam_app_id_fast(steam_url)
-        except Exception as e:
-            print(f"  ⚠️  Редирект ошибка: {e}")
-            # Пробуем извлечь из исходного URL
-            app_id = extract_steam_app_id_fast(itad_url)
-
-        if not app_id:
-            app_id = extract_steam_app_id_fast(steam_url) or ""
-        
-        expiry = deal.get("expiry") or it.get("expiry")
-        start = deal.get("start") or it.get("start")
-
-        # appid: теперь извлекаем из конечного Steam URL
-        app_id = extract_steam_app_id_fast(steam_url) or ""
-
-        # 🔥 Парсим изображения со страницы Steam
-        image_url = None
-        if app_id and scrape_left > 0:
-            scrape_left -= 1
-            try:
-                images = get_steam_images_from_page(app_id, steam_url)
-                image_url = (
-                    images.get('header') or 
-                    images.get('hero') or 
-                    images.get('capsule') or 
-                    images.get('library')
-                )
-            except Exception:
-                pass
-        
-        # Фоллбэк на стандартные URL
-        if not image_url and app_id:
-            # Для новых игр (> 10 млн) используем новый формат
-            app_num = int(app_id) if app_id.isdigit() else 0
-            if app_num >= 10000000:  # Новые игры
-                image_url = f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{app_id}/header.jpg"
-            else:  # Старые игры
-                image_url = f"https://cdn.cloudflare.steamstatic.com/steam/apps/{app_id}/header.jpg"
-
         out.append({
             "store": "steam",
-            "external_id": app_id,
+            "external_id": "",
             "kind": "free_to_keep",
             "title": title,
-            "url": steam_url,  # 🔥 Сохраняем конечный Steam URL, а не itad.link!
-            "image_url": image_url,
+            "url": itad_url,
+            "image_url": None,
             "source": "itad",
-            "starts_at": start,
-            "ends_at": expiry,
+            "starts_at": deal.get("start") or it.get("start"),
+            "ends_at": deal.get("expiry") or it.get("expiry"),
         })
 
+    # 2) медленный этап: редиректы + обложки, параллельно
+    enrich_steam_items(out, scrape_limit=10)
     return out
 
+
+STEAM_ENRICH_WORKERS = 10  # сколько одновременных запросов к Steam/itad.link
+
+
+@functools.lru_cache(maxsize=4096)
+def itad_final_url(url: str) -> str:
+    """
+    Конечный Steam URL для itad.link: HEAD с редиректами, только сеть.
+    Таблицу itad_redirects читает и пишет enrich_steam_items в своём потоке —
+    до и после пула, пачкой. Неудача — исключение (lru_cache его не запоминает).
+    """
+    resp = resolve_redirects(url, timeout=8)
+    final_url = str(resp.url)
+    if "store.steampowered.com" not in final_url:
+        raise ValueError(f"редирект не в Steam: {final_url[:80]}")
+    return final_url
+
+
+def itad_redirects_load(urls: list[str]) -> dict[str, str]:
+    """Уже известные редиректы itad.link -> Steam одним запросом."""
+    if not urls:
+        return {}
+    with db_conn() as conn:
+        rows = conn.execute(
+            f"SELECT url, final_url FROM itad_redirects WHERE url IN ({','.join('?' * len(urls))})",
+            urls,
+        )
+        return {r[0]: r[1] for r in rows}
+
+
+def itad_redirects_save(found: dict[str, str]) -> None:
+    if not found:
+        return
+    now = int(time.time())
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO itad_redirects (url, final_url, checked_at) VALUES (?,?,?)",
+            [(url, final_url, now) for url, final_url in found.items()],
+        )
+        conn.commit()
+
+
+def steam_resolve_item(item: dict, known: dict[str, str], found: dict[str, str]) -> None:
+    """
+    Получаем конечный Steam URL вместо itad.link и appid (мутирует item).
+    known — редиректы из БД; новые складываем в found (БД в потоках пула не трогаем).
+    """
+    itad_url = item["url"]
+    steam_url = itad_url
+
+    try:
+        if "itad.link" in itad_url:
+            steam_url = known.get(itad_url)
+            if steam_url is None:
+                steam_url = found[itad_url] = itad_final_url(itad_url)
+            if DEBUG:
+                print(f"  🔄 Редирект: {itad_url[:50]}... -> {steam_url[:60]}...")
+    except Exception as e:
+        steam_url = itad_url
+        print(f"  ⚠️  Редирект ошибка: {e}")
+
+    item["url"] = steam_url  # 🔥 Сохраняем конечный Steam URL, а не itad.link!
+    # appid: извлекаем из конечного Steam URL (при ошибке редиректа это исходный URL)
+    item["external_id"] = extract_steam_app_id_fast(steam_url) or ""
+
+
+def steam_scrape_item(item: dict) -> None:
+    """
+    🔥 Парсим изображения со страницы Steam (через кэш steam_images).
+    """
+    try:
+        images = steam_images_cached(item["external_id"], item["url"])
+        item["image_url"] = (
+            images.get('header') or
+            images.get('hero') or
+            images.get('capsule') or
+            images.get('library')
+        )
+    except Exception:
+        pass
+
+
+def enrich_steam_items(items: list[dict], scrape_limit: int = 10) -> None:
+    """
+    Пост-обработка после fetch_itad_steam: все сетевые запросы идут
+    в пуле из STEAM_ENRICH_WORKERS потоков, а не по одному.
+    Время ~ ceil(N / workers) * RTT вместо N * RTT.
+    """
+    if not items:
+        return
+
+    known = itad_redirects_load([x["url"] for x in items if "itad.link" in x["url"]])
+    found: dict[str, str] = {}
+
+    with ThreadPoolExecutor(max_workers=STEAM_ENRICH_WORKERS) as pool:
+        list(pool.map(lambda x: steam_resolve_item(x, known, found), items))
+
+        # парсим страницы только для первых scrape_limit игр с appid
+        to_scrape = [x for x in items if x["external_id"]][:scrape_limit]
+        list(pool.map(steam_scrape_item, to_scrape))
+
+    itad_redirects_save(found)
+
+    # Фоллбэк на стандартные URL
+    for item in items:
+        app_id = item["external_id"]
+        if item["image_url"] or not app_id:
+            continue
+        # Для новых игр (> 10 млн) используем новый формат
+        app_num = int(app_id) if app_id.isdigit() else 0
+        if app_num >= 10000000:  # Новые игры
+            item["image_url"] = f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{app_id}/header.jpg"
+        else:  # Старые игры
+            item["image_url"] = f"https://cdn.cloudflare.steamstatic.com/steam/apps/{app_id}/header.jpg"
+
+
 def fetch_itad_steam_hot_deals(
     min_cut: int = 70,
     limit: int = 200,
@@ -1227,97 +1899,95 @@ def fetch_itad_steam_hot_deals(
         "sort": "-cut",
     }
 
-    r = requests.get(endpoint, params=params, timeout=25)
+    r = SESSION.get(endpoint, params=params, timeout=25, stream=True)
 
     print("ITAD URL:", r.url)
     print("ITAD STATUS:", r.status_code)
 
     if r.status_code >= 400:
-        print("ITAD ERROR BODY:", (r.text or "")[:800])
-    r.raise_for_status()
-    data = r.json()
-
-    items = data if isinstance(data, list) else (
-        data.get("list") or data.get("data") or data.get("items") or data.get("result") or []
-    )
-
-    cand_70_89: list[dict] = []
-    cand_90_plus: list[dict] = []
-    seen_urls = set()
-
-    def push_candidate(it: dict, deal: dict, cut: int, url: str) -> None:
-        title = it.get("title") or it.get("name") or deal.get("title") or deal.get("name") or "Steam deal"
-        expiry = deal.get("expiry") or it.get("expiry")
-        start = deal.get("start") or it.get("start")
+        # 800 байт руками: r.text декодировал бы всё тело (и гонял chardet)
+        print("ITAD ERROR BODY:", r.content[:800].decode("utf-8", "replace"))
+        r.raise_for_status()
 
-        price_obj = deal.get("price") or {}
-        price_amount = price_obj.get("amount") if isinstance(price_obj, dict) else None
-        currency = price_obj.get("currency") if isinstance(price_obj, dict) else None
-        currency = normalize_currency(currency)  # USD/RUB/"" (как мы обсуждали)
+    # корзины url -> кандидат: dict сам дедуплицирует по url
+    # (limit режется до 200 — Bloom-фильтр на таком объёме только лишняя работа)
+    b70: dict[str, dict] = {}
+    b90: dict[str, dict] = {}
 
-        regular_obj = deal.get("regular") or deal.get("regularPrice") or deal.get("regular_price") or {}
-        old_amount = regular_obj.get("amount") if isinstance(regular_obj, dict) else None
-
-        cand = {
-            "store": "steam",
-            "external_id": "",           # не обязательно для hot_deal
-            "kind": "hot_deal",
-            "title": title,
-            "url": url,
-            "image_url": None,           # пусть сайт сам строит header по appid
-            "source": "itad",
-            "starts_at": start,
-            "ends_at": expiry,
-            "discount_pct": int(cut),
-            "price_old": old_amount,
-            "price_new": price_amount,
-            "currency": currency,
-        }
-
-        if 70 <= cut <= 89:
-            cand_70_89.append(cand)
-        elif cut >= 90:
-            cand_90_plus.append(cand)
-
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-
-        deal = it.get("deal") if isinstance(it.get("deal"), dict) else it
-        cut = deal.get("cut")
-        if cut is None:
-            continue
-        try:
-            cut = int(cut)
-        except Exception:
-            continue
-
-        if cut < min_cut:
-            continue
-
-        # не берём бесплатные, чтобы не дублировать free_to_keep
-        price_obj = deal.get("price") or {}
-        price_amount = price_obj.get("amount") if isinstance(price_obj, dict) else None
-        if cut == 100 or price_amount == 0:
-            continue
-
-        url = deal.get("url") or it.get("url")
-        if not url or url in seen_urls:
-            continue
-        seen_urls.add(url)
-
-        push_candidate(it, deal, cut, url)
+    # после break хвост не дочитан, а разбор может упасть на битом JSON —
+    # соединение отдаём пулу в любом случае
+    try:
+        for it in itad_stream_items(r):
+            if not isinstance(it, dict):
+                continue
+
+            deal = it.get("deal") if isinstance(it.get("deal"), dict) else it
+            cut = deal.get("cut")
+            if cut is None:
+                continue
+            try:
+                cut = int(cut)
+            except Exception:
+                continue
 
-    import random
-    random.shuffle(cand_70_89)
-    random.shuffle(cand_90_plus)
+            # sort=-cut: дальше скидки только меньше — хвост ответа не читаем
+            if cut < min_cut:
+                break
 
-    picked = cand_70_89[:mix_70_89] + cand_90_plus[:mix_90_plus]
+            if 70 <= cut <= 89:
+                bucket = b70
+            elif cut >= 90:
+                bucket = b90
+            else:
+                continue
+
+            # не берём бесплатные, чтобы не дублировать free_to_keep
+            price_obj = deal.get("price") or {}
+            price_amount = price_obj.get("amount") if isinstance(price_obj, dict) else None
+            if cut == 100 or price_amount == 0:
+                continue
+
+            url = deal.get("url") or it.get("url")
+            if not url or url in b70 or url in b90:
+                continue
+
+            title = it.get("title") or it.get("name") or deal.get("title") or deal.get("name") or "Steam deal"
+            currency = price_obj.get("currency") if isinstance(price_obj, dict) else None
+            regular_obj = deal.get("regular") or deal.get("regularPrice") or deal.get("regular_price") or {}
+            old_amount = regular_obj.get("amount") if isinstance(regular_obj, dict) else None
+
+            bucket[url] = {
+                "store": "steam",
+                "external_id": "",           # не обязательно для hot_deal
+                "kind": "hot_deal",
+                "title": title,
+                "url": url,
+                "image_url": None,           # пусть сайт сам строит header по appid
+                "source": "itad",
+                "starts_at": deal.get("start") or it.get("start"),
+                "ends_at": deal.get("expiry") or it.get("expiry"),
+                "discount_pct": cut,
+                "price_old": old_amount,
+                "price_new": price_amount,
+                "currency": normalize_currency(currency),  # USD/RUB/""
+            }
+    finally:
+        r.close()
+
+    cand_70_89 = list(b70.values())
+    cand_90_plus = list(b90.values())
+    # sample(k) вместо полного shuffle — нам нужны только k штук из корзины
+    picked = (
+        random.sample(cand_70_89, min(mix_70_89, len(cand_70_89)))
+        + random.sample(cand_90_plus, min(mix_90_plus, len(cand_90_plus)))
+    )
 
-    # если не хватило одной корзины — добиваем из другой
+    # если не хватило одной корзины — добиваем из другой (сначала 90+)
     if len(picked) < keep:
-        rest = cand_90_plus[mix_90_plus:] + cand_70_89[mix_70_89:]
-        picked += rest[: (keep - len(picked))]
+        taken = {c["url"] for c in picked}
+        for bucket in (cand_90_plus, cand_70_89):
+            rest = [c for c in bucket if c["url"] not in taken]
+            picked += random.sample(rest, min(keep - len(picked), len(rest)))
 
     return picked[:keep]
 
@@ -1349,20 +2019,7 @@ def epic_product_url(e: dict, locale: str) -> str:
     return f"https://store.epicgames.com/{loc}/free-games"
 
 
-def epic_canonicalize(url: str) -> str:
-    try:
-        resp = requests.get(
-            url,
-            timeout=15,
-            allow_redirects=True,
-            headers={"User-Agent": "Mozilla/5.0"}
-        )
-        # если страница реально существует, resp.url станет канонической
-        if resp.status_code in (200, 301, 302, 303, 307, 308):
-            return str(resp.url)
-    except Exception:
-        pass
-    return url
+EPIC_URL_WORKERS = 8  # параллельные проверки URL в fetch_epic
 
 
 def fetch_epic(locale=None, country=None):
@@ -1373,9 +2030,9 @@ def fetch_epic(locale=None, country=None):
     url = "https://store-site-backend-static-ipv4.ak.epicgames.com/freeGamesPromotions"
     params = {"locale": locale, "country": country, "allowCountries": country}
 
-    r = requests.get(url, params=params, timeout=25, headers={"User-Agent": "Mozilla/5.0"})
+    r = SESSION.get(url, params=params, timeout=25)
     r.raise_for_status()
-    data = r.json()
+    data = json_loads(r.content)
 
     root = data or {}
     catalog = root.get("data", {}).get("Catalog", {})
@@ -1383,16 +2040,15 @@ def fetch_epic(locale=None, country=None):
 
     now = datetime.now(timezone.utc)
 
-    def parse_iso(s):
-        if not s:
-            return None
-        s = s.replace("Z", "+00:00")
-        try:
-            return datetime.fromisoformat(s)
-        except Exception:
-            return None
+    def is_active(off) -> bool:
+        sdt = parse_iso_utc_cached(off.get("startDate"))
+        if not sdt or sdt > now:
+            return False  # endDate даже не парсим
+        edt = parse_iso_utc_cached(off.get("endDate"))
+        return bool(edt) and now <= edt
 
     out = []
+    todo = []  # (индекс в out, элемент, title, кандидаты URL)
     for e in elements:
         promos = (e.get("promotions") or {})
         blocks = (promos.get("promotionalOffers") or [])
@@ -1402,25 +2058,12 @@ def fetch_epic(locale=None, country=None):
         for b in blocks:
             offers.extend((b or {}).get("promotionalOffers") or [])
 
-        # ищем активный оффер
-        active = None
-        for off in offers:
-            sdt = parse_iso(off.get("startDate"))
-            edt = parse_iso(off.get("endDate"))
-            if sdt and edt and sdt <= now <= edt:
-                active = off
-                break
+        # ищем активный оффер (первый подходящий)
+        active = next((off for off in offers if is_active(off)), None)
         if not active:
             continue
 
         title = e.get("title") or "Epic freebie"
-        cands = epic_url_candidates(e, locale)
-        page_url = epic_pick_working_url(cands)
-
-        if epic_is_dlc(e):
-          print("EPIC DLC:", title, "->", page_url)
-        else:
-          print("EPIC GAME:", title, "->", page_url)
 
         img = None
         for ki in (e.get("keyImages") or []):
@@ -1449,12 +2092,15 @@ def fetch_epic(locale=None, country=None):
         else:
             continue  # пропускаем
 
+        # URL проверяем позже, параллельно (см. ниже)
+        todo.append((len(out), e, title, epic_url_candidates(e, locale)))
+
         out.append({
             "store": "epic",
-            "external_id": str(e.get("id") or e.get("namespace") or page_url),
+            "external_id": str(e.get("id") or e.get("namespace") or ""),
             "kind": kind,
             "title": title,
-            "url": page_url,
+            "url": None,
             "image_url": img,
             "source": "epic",
             "starts_at": start,
@@ -1467,6 +2113,19 @@ def fetch_epic(locale=None, country=None):
             "currency": price.get("currencyCode") if kind == "hot_deal" else None,
         })
 
+    # каждый epic_pick_working_url — до 3 блокирующих GET, поэтому гоняем их
+    # пулом: время ~ max(RTT) вместо суммы по всем раздачам
+    if todo:
+        with ThreadPoolExecutor(max_workers=EPIC_URL_WORKERS) as pool:
+            urls = pool.map(epic_pick_working_url, [c for _, _, _, c in todo])
+            for (i, e, title, _), page_url in zip(todo, urls):
+                out[i]["url"] = page_url
+                if not out[i]["external_id"]:
+                    out[i]["external_id"] = page_url
+
+                if DEBUG:
+                    print("EPIC DLC:" if epic_is_dlc(e) else "EPIC GAME:", title, "->", page_url)
+
     return out
 
 def epic_is_dlc(e: dict) -> bool:
@@ -1536,11 +2195,9 @@ def epic_pick_working_url(cands: list[str]) -> str:
     Проверяем первые 3 кандидата, но принимаем любой успешный ответ (200-399).
     Если ничего не работает - возвращаем первый кандидат.
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
-    
     for u in cands[:3]:
         try:
-            r = requests.get(u, timeout=8, allow_redirects=True, headers=headers)
+            r = resolve_redirects(u, timeout=8)
             # 🔥 Принимаем любой успешный код (200-399)
             if 200 <= r.status_code < 400:
                 return str(r.url)
@@ -1556,31 +2213,33 @@ def epic_pick_working_url(cands: list[str]) -> str:
 # manual_news
 # --------------------
 
-import re
-import requests
 from datetime import datetime
 from html import unescape
 
 ADMIN_KEY = os.getenv("ADMIN_KEY", "")
 
+OG_TITLE_RE = re.compile(r'property=["\']og:title["\']\s+content=["\']([^"\']+)', re.IGNORECASE)
+OG_IMAGE_RE = re.compile(r'property=["\']og:image["\']\s+content=["\']([^"\']+)', re.IGNORECASE)
+TITLE_TAG_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE)
+
 def fetch_og(url: str) -> dict:
     """
     Достаём og:title / og:image с любой страницы.
     Работает для большинства магазинов/страниц.
     """
     try:
-        r = requests.get(url, timeout=10, headers={
+        r = SESSION.get(url, timeout=10, headers={
             "User-Agent": "Mozilla/5.0 (compatible; FreeRGbot/1.0; +https://freerg.store)"
         })
         html = r.text
 
         def pick(pattern):
-            m = re.search(pattern, html, re.IGNORECASE)
+            m = pattern.search(html)
             return unescape(m.group(1)).strip() if m else None
 
-        og_title = pick(r'property=["\']og:title["\']\s+content=["\']([^"\']+)')
-        og_image = pick(r'property=["\']og:image["\']\s+content=["\']([^"\']+)')
-        title_tag = pick(r"<title[^>]*>(.*?)</title>")
+        og_title = pick(OG_TITLE_RE)
+        og_image = pick(OG_IMAGE_RE)
+        title_tag = pick(TITLE_TAG_RE)
 
         return {
             "title": og_title or title_tag,
@@ -1592,7 +2251,7 @@ def fetch_og(url: str) -> dict:
 from fastapi import Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 
-ADD_NEWS_PAGE = Template("""
+ADD_NEWS_PAGE = compile_template("add_news", """
 <!doctype html><html><head>
 <meta charset="utf-8"/>
 <meta name="robots" content="noindex,nofollow">
@@ -1705,6 +2364,7 @@ def admin_news_add(
         old_val, new_val, currency, (ends_at.strip() or None)
     ))
     conn.commit()
+    invalidate_page_cache()
     conn.close()
 
     return RedirectResponse(url=f"/admin/news?key={key}", status_code=302)
@@ -2055,10 +2715,10 @@ async def admin_exclusive_delete(exc_id: int, key: str = ""):
         return {"ok": False, "error": "forbidden"}
     
     try:
-        conn = db()
-        conn.execute("DELETE FROM manual_news WHERE id=?", (exc_id,))
-        conn.commit()
-        conn.close()
+        with db_conn() as conn:
+            conn.execute("DELETE FROM manual_news WHERE id=?", (exc_id,))
+            conn.commit()
+        invalidate_page_cache()
         
         return {"ok": True}
     except Exception as e:
@@ -2075,13 +2735,13 @@ async def admin_exclusive_toggle(exc_id: int, key: str, request: Request):
     
     try:
         # Читаем JSON из body
-        body = await request.json()
+        body = json_loads(await request.body())
         is_pub = body.get('is_published', 1)
         
-        conn = db()
-        conn.execute("UPDATE manual_news SET is_published=? WHERE id=?", (is_pub, exc_id))
-        conn.commit()
-        conn.close()
+        with db_conn() as conn:
+            conn.execute("UPDATE manual_news SET is_published=? WHERE id=?", (is_pub, exc_id))
+            conn.commit()
+        invalidate_page_cache()
         
         return {"ok": True}
     except Exception as e:
@@ -2093,11 +2753,21 @@ async def admin_exclusive_toggle(exc_id: int, key: str, request: Request):
 # --------------------
 # SAVE + POST
 # --------------------
+# один и тот же объект строки на каждый вызов — кэш prepared-statements sqlite3 всегда попадает
+INSERT_DEAL_SQL = (
+    "INSERT OR IGNORE INTO deals (id,store,external_id,kind,title,url,image_url,source,starts_at,ends_at,discount_pct,price_old,price_new,currency,posted,created_at,is_new) "
+    "SELECT ?,?,?,?,?,?,?,?,?,?,?,?,?,?,0,?,1 "
+    "WHERE NOT EXISTS (SELECT 1 FROM deals WHERE store=? AND url=?)"
+)
+
+
 def save_deals(deals: list[dict]):
-    conn = db()
     now = datetime.now(timezone.utc).isoformat()
 
-    new_items = 0
+    rows = []
+    # повторы внутри батча (раздачи + hot deals Steam пересекаются) отсекаем
+    # в памяти — в SQLite уходит каждая ссылка один раз
+    seen: set[str] = set()
     for d in deals:
         store = d.get("store") or ""
         external_id = d.get("external_id") or ""
@@ -2106,58 +2776,105 @@ def save_deals(deals: list[dict]):
             continue
 
         did = deal_id(store, external_id, url)
+        if did in seen:
+            continue
+        seen.add(did)
+
+        rows.append((
+            did,
+            store,
+            external_id,
+            d.get("kind", ""),
+            d.get("title", ""),
+            url,
+            d.get("image_url", ""),
+            d.get("source", ""),
+            d.get("starts_at"),
+            d.get("ends_at"),
+            d.get("discount_pct"),
+            d.get("price_old"),
+            d.get("price_new"),
+            d.get("currency"),
+            now,
+            store,
+            url,
+        ))
 
-        cur = conn.execute(
-            "INSERT OR IGNORE INTO deals (id,store,external_id,kind,title,url,image_url,source,starts_at,ends_at,discount_pct,price_old,price_new,currency,posted,created_at) "
-            "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,0,?)",
-            (
-                did,
-                store,
-                external_id,
-                d.get("kind", ""),
-                d.get("title", ""),
-                url,
-                d.get("image_url", ""),
-                d.get("source", ""),
-                d.get("starts_at"),
-                d.get("ends_at"),
-                d.get("discount_pct"),
-                d.get("price_old"),
-                d.get("price_new"),
-                d.get("currency"),
-                now,
-            ),
-        )
-        if cur.rowcount == 1:
-            new_items += 1
-
-    conn.commit()
-    conn.close()
+    if not rows:
+        return 0
+
+    # одна транзакция на весь батч: один fsync вместо N
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.executemany(INSERT_DEAL_SQL, rows)
+        # для executemany rowcount = сумма вставленных строк (IGNORE/NOT EXISTS не считаются)
+        new_items = cur.rowcount
+        conn.commit()
+    if new_items:
+        invalidate_page_cache()
     return new_items
 
+TG_GO_URL_TAIL = "?src=tg&utm_campaign=freeredeemgames&utm_content="
+
+
 def tg_go_url(deal_id: str, utm_content: str) -> str:
-    include_button = (random.random() < 0.4)  # 40% с кнопкой, 60% без
-    return f"{SITE_BASE}/go/{deal_id}?src=tg&utm_campaign=freeredeemgames&utm_content={utm_content}"
+    return GO_URL_PREFIX + deal_id + TG_GO_URL_TAIL + utm_content
 
 INCLUDE_BUTTON = True  # можно потом привязать к .env
 
+# kind -> (заголовок, варианты текста кнопки, utm_content)
+TG_KIND_META = {
+    "free_to_keep": ("🎁 *Бесплатно навсегда*", ("🧭 Открыть", "🔎 Подробности", "🎮 Забрать"), "free_forever"),
+    "free_weekend": ("⏱ *Free Weekend (временно)*", ("▶️ Играть", "🧭 Открыть", "🔎 Подробности"), "free_weekend"),
+    None: ("🎮 *Акция*", ("🧭 Открыть", "🔎 Подробности"), "other"),
+}
+TG_PRIME_NOTE = "⚠️ Требуется Prime Gaming/подписка.\n"
+
+
+@functools.lru_cache(maxsize=None)  # магазинов единицы — строка собирается один раз
+def tg_tags(st: str) -> str:
+    return f"\n#freegame #{st} #giveaway" if st else "\n#freegame #giveaway"
+
 def include_button() -> bool:
     return bool(INCLUDE_BUTTON)
 
 
+MARK_POSTED_ATTEMPTS = 5  # потерянная отметка posted=1 = повторный пост в канал
+
+
+def fetch_unposted(sql: str, params: list) -> list:
+    with db_conn() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def mark_posted(ids: list[str]) -> None:
+    """posted=1 одним UPDATE; занятую БД ждём дольше одного busy_timeout."""
+    sql = f"UPDATE deals SET posted=1 WHERE id IN ({','.join('?' * len(ids))})"
+    for attempt in range(1, MARK_POSTED_ATTEMPTS + 1):
+        try:
+            with db_conn() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(sql, ids)
+                conn.commit()
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == MARK_POSTED_ATTEMPTS:
+                raise
+            print(f"MARK POSTED RETRY {attempt}:", e)
+            time.sleep(attempt)
+
+
 async def post_unposted_to_telegram(limit: int = POST_LIMIT, store: str | None = None):
     """
     Постим kind in ('free_to_keep', 'free_weekend').
     Если store задан (steam/epic/...), постим только для этого магазина.
     Картинки:
       - Epic: image_url из БД
-      - Steam: header.jpg по app_id из URL/редиректа
+      - Steam: image_url, сохранённый при fetch; иначе header.jpg по app_id из URL
     """
     if not bot or not TG_CHAT_ID:
         return {"posted": 0, "queued": 0, "reason": "bot/chat_id missing"}
 
-    conn = db()
-
     sql = """
         SELECT id,store,kind,title,url,image_url,ends_at
         FROM deals
@@ -2168,54 +2885,39 @@ async def post_unposted_to_telegram(limit: int = POST_LIMIT, store: str | None =
         sql += " AND store=?"
         params.append(store)
 
-    # Сначала "навсегда", потом "временно" (чтобы лента приятнее смотрелась)
+    # В батч берём сначала "навсегда", потом "временно": при нехватке LIMIT
+    # выпадают временные. 'free_to_keep' < 'free_weekend' по алфавиту, так что это
+    # просто ORDER BY kind — порядок частичного индекса idx_deals_pending
+    # (store, kind, created_at), без сортировки. Порядок постов в канале при
+    # TG_SEND_CONCURRENCY > 1 не гарантирован — строго по порядку только при 1.
     sql += """
-        ORDER BY
-            CASE kind WHEN 'free_to_keep' THEN 0 ELSE 1 END,
-            created_at ASC
+        ORDER BY kind ASC, created_at ASC
         LIMIT ?
     """
     params.append(limit)
 
-    rows = conn.execute(sql, tuple(params)).fetchall()
-    queued = len(rows)
-    posted_count = 0
+    choice = random.choice
+    with_button = include_button()
+    sem = asyncio.Semaphore(TG_SEND_CONCURRENCY)
+    failed = False  # после первой ошибки (кроме flood control) новые отправки не начинаем
 
-    for did, st, kind, title, url, image_url, ends_at in rows:
+    async def send_one(row) -> str | None:
+        nonlocal failed
+        did, st, kind, title, url, image_url, ends_at = row
         st = (st or "").strip().lower()
 
-        badge = {
-            "steam": "🎮 Steam",
-            "epic": "🟦 Epic",
-            "gog": "🟪 GOG",
-            "prime": "🟨 Prime",
-        }.get(st, st or "Store")
+        badge = store_badge(st)
 
-        extra = ""
-        if st == "prime":
-            extra = "⚠️ Требуется Prime Gaming/подписка.\n"
+        extra = TG_PRIME_NOTE if st == "prime" else ""
 
         # заголовок + кнопка по типу раздачи
-        if kind == "free_to_keep":
-          header = "🎁 *Бесплатно навсегда*"
-          button_pool = ["🧭 Открыть", "🔎 Подробности", "🎮 Забрать"]
-          utm_content = "free_forever"
-        elif kind == "free_weekend":
-          header = "⏱ *Free Weekend (временно)*"
-          button_pool = ["▶️ Играть", "🧭 Открыть", "🔎 Подробности"]
-          utm_content = "free_weekend"
-        else:
-          header = "🎮 *Акция*"
-          button_pool = ["🧭 Открыть", "🔎 Подробности"]
-          utm_content = "other"
+        header, button_pool, utm_content = TG_KIND_META.get(kind, TG_KIND_META[None])
 
-        button_text = random.choice(button_pool)
+        button_text = choice(button_pool)
 
         site_url = tg_go_url(did, utm_content)
 
-
-
-        tags = f"\n#freegame #{st} #giveaway" if st else "\n#freegame #giveaway"
+        tags = tg_tags(st)
 
         # если ends_at пустой — строку "До" лучше не показывать
         expires_line = f"⏳ До: {format_expiry(ends_at)}\n" if ends_at else ""
@@ -2228,17 +2930,18 @@ async def post_unposted_to_telegram(limit: int = POST_LIMIT, store: str | None =
             f"{tags}"
         )
 
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton(button_text, url=site_url)]]) if include_button() else None
-
+        kb = InlineKeyboardMarkup([[InlineKeyboardButton(button_text, url=site_url)]]) if with_button else None
 
         # выбор картинки
         photo = None
         if st == "epic" and image_url:
             photo = image_url
         elif st == "steam":
-            photo = steam_header_image_from_url(url)
+            # обложку кладёт в image_url ещё fetch_itad_steam (enrich_steam_items);
+            # appid из URL — только для старых строк без неё
+            photo = image_url or steam_header_image_from_url(url)
 
-        try:
+        async def deliver() -> None:
             # 🔥 ФИКС: Проверяем что photo валидный URL
             if photo and photo.startswith("http") and ("steamstatic.com" in photo or "epicgames.com" in photo):
                 try:
@@ -2249,46 +2952,62 @@ async def post_unposted_to_telegram(limit: int = POST_LIMIT, store: str | None =
                         parse_mode="Markdown",
                         reply_markup=kb,
                     )
+                    return
+                except RetryAfter:
+                    raise  # flood control — не повод слать текстом, ждём и повторяем
                 except Exception as e:
                     # Если фото не загрузилось - постим текстом
                     print(f"Photo failed, posting as text: {e}")
-                    await bot.send_message(
-                        chat_id=TG_CHAT_ID,
-                        text=text,
-                        parse_mode="Markdown",
-                        reply_markup=kb,
-                        disable_web_page_preview=False,
-                    )
-            else:
-                # Без фото
-                await bot.send_message(
-                    chat_id=TG_CHAT_ID,
-                    text=text,
-                    parse_mode="Markdown",
-                    reply_markup=kb,
-                    disable_web_page_preview=False,
-                )
-
-            conn.execute("UPDATE deals SET posted=1 WHERE id=?", (did,))
-            conn.commit()
-            posted_count += 1
+            await bot.send_message(
+                chat_id=TG_CHAT_ID,
+                text=text,
+                parse_mode="Markdown",
+                reply_markup=kb,
+                disable_web_page_preview=False,
+            )
+
+        async with sem:
+            for attempt in range(TG_FLOOD_RETRIES + 1):
+                if failed:
+                    return None
+                try:
+                    await deliver()
+                    posted_ids.append(did)
+                    return did
+
+                except RetryAfter as e:
+                    # пачка из TG_SEND_CONCURRENCY отправок легко ловит flood control:
+                    # ждём, сколько сказал Telegram, а не рубим весь батч
+                    wait = e.retry_after
+                    wait = wait.total_seconds() if isinstance(wait, timedelta) else float(wait)
+                    if attempt == TG_FLOOD_RETRIES:
+                        print(f"TG FLOOD: giving up after {TG_FLOOD_RETRIES} retries")
+                        failed = True
+                        return None
+                    print(f"TG FLOOD: retry in {wait:.0f}s ({attempt + 1}/{TG_FLOOD_RETRIES})")
+                    await asyncio.sleep(wait + 1)
 
-        except Exception as e:
-            print("TG SEND ERROR:", e)
-            break
-    
-    manual = conn.execute("""
-        SELECT
-            'm_' || id as id,
-            store, kind, title, url, image_url, ends_at,
-            price_old, price_new, currency
-        FROM manual_news
-        WHERE is_published=1
-        ORDER BY datetime(created_at) DESC
-        LIMIT 20
-    """).fetchall()
+                except Exception as e:
+                    print("TG SEND ERROR:", e)
+                    failed = True
+                    return None
+
+    # SQLite — только в потоке: джобы магазинов идут параллельно, и ожидание
+    # блокировки записи (busy_timeout) не должно стопорить цикл событий
+    rows = await asyncio.to_thread(fetch_unposted, sql, params)
+
+    # до TG_SEND_CONCURRENCY отправок одновременно; posted=1 ставим одним UPDATE
+    # отправленные копятся в posted_ids по мере успеха: даже если прогон оборвут
+    # (остановка сервиса), в finally помечаем всё, что уже ушло в канал
+    posted_ids: list[str] = []
+    try:
+        results = await asyncio.gather(*(send_one(r) for r in rows))
+    finally:
+        if posted_ids:
+            await asyncio.to_thread(mark_posted, posted_ids)
+    queued = len(results)
+    posted_count = len(posted_ids)
 
-    conn.close()
     return {"posted": posted_count, "queued": queued, "store": store or "all"}
 
 async def job_async(store: str = "steam"):
@@ -2302,29 +3021,35 @@ async def job_async(store: str = "steam"):
       - epic: до 2 за прогон (чтобы не шумел)
       - другие: до 3 за прогон (можно менять)
     """
-    async with JOB_LOCK:
+    # сборщики и save_deals блокирующие — уходят в поток, цикл остаётся
+    # свободным для запросов сайта (джоб теперь крутится в цикле приложения)
+    st = (store or "").strip().lower()
+    async with JOB_LOCKS[st]:
         try:
-            st = (store or "").strip().lower()
-
             if st == "steam":
-                deals = fetch_itad_steam() + fetch_itad_steam_hot_deals(min_cut=70, limit=200, keep=60)
-                new_items = save_deals(deals)
+                # раздачи и скидки — два независимых запроса к ITAD, ждём их параллельно
+                free, hot = await asyncio.gather(
+                    asyncio.to_thread(fetch_itad_steam),
+                    asyncio.to_thread(fetch_itad_steam_hot_deals, min_cut=70, limit=200, keep=60),
+                )
+                deals = free + hot
+                new_items = await asyncio.to_thread(save_deals, deals)
                 tg = await post_unposted_to_telegram(limit=POST_LIMIT, store="steam")
 
             elif st == "epic":
                 print("🟦 EPIC JOB RUN @", datetime.now(BISHKEK_TZ))
-                deals = fetch_epic()
-                new_items = save_deals(deals)
+                deals = await asyncio.to_thread(fetch_epic)
+                new_items = await asyncio.to_thread(save_deals, deals)
                 tg = await post_unposted_to_telegram(limit=2, store="epic")
 
             elif st == "gog":
-                deals = fetch_itad_gog()
-                new_items = save_deals(deals)
+                deals = await asyncio.to_thread(fetch_itad_gog)
+                new_items = await asyncio.to_thread(save_deals, deals)
                 tg = await post_unposted_to_telegram(limit=3, store="gog")
 
             elif st == "prime":
-                deals = fetch_prime_blog()
-                new_items = save_deals(deals)
+                deals = await asyncio.to_thread(fetch_prime_blog)
+                new_items = await asyncio.to_thread(save_deals, deals)
                 tg = await post_unposted_to_telegram(limit=1, store="prime")
 
             else:
@@ -2344,7 +3069,22 @@ def fetch_prime(): return []
 # --------------------
 # WEBSITE
 # --------------------
-PAGE = Template("""
+def static_version(name: str) -> str:
+    """Короткий хэш содержимого статики для ?v= (меняется только при деплое)."""
+    try:
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+    except OSError:
+        return "0"
+
+
+# стили главной вынесены в static/app.css: браузер кэширует их навсегда,
+# а Jinja больше не гоняет ~10 КБ CSS через каждый рендер
+CSS_VERSION = static_version("app.css")
+# "Наверх" и прячущаяся шапка — static/app.js (defer: качается параллельно с HTML)
+JS_VERSION = static_version("app.js")
+
+PAGE = compile_template("index", """
 <!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -2358,658 +3098,15 @@ PAGE = Template("""
     <meta name="robots" content="noindex,nofollow">
     <title>Free Redeem Games Store - Бесплатные игры</title>
     <link rel="icon" href="data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><text y='75' font-size='75'>🎮</text></svg>">
-    <style>
-        :root {
-            --bg-primary: #0a0e1a;
-            --bg-card: #1a1f36;
-            --bg-hover: #252a44;
-            --text-primary: #e2e8f0;
-            --text-secondary: #94a3b8;
-            --text-muted: #64748b;
-            --accent: #667eea;
-            --accent-hover: #764ba2;
-            --border: rgba(255, 255, 255, 0.1);
-            --shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
-            --radius: 12px;
-        }
-        
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: var(--bg-primary);
-            color: var(--text-primary);
-            line-height: 1.6;
-            padding-top: 0px; /* 🔥 Увеличил отступ чтобы заголовки не налезали */
-            background-image: 
-                radial-gradient(circle at 20% 10%, rgba(102, 126, 234, 0.08) 0%, transparent 50%),
-                radial-gradient(circle at 80% 90%, rgba(118, 75, 162, 0.08) 0%, transparent 50%);
-        }
-                
-        .collapse-btn{
-            margin-top:10px;
-            padding:10px 12px;
-            border-radius:12px;
-            border:1px solid rgba(255,255,255,.12);
-            background:rgba(255,255,255,.06);
-            color:#e2e8f0;
-            font-weight:700;
-            cursor:pointer;
-        }
-        .collapse-btn:hover{ background:rgba(255,255,255,.10); }
-
-        
-        /* ШАПКА */
-        .header {
-            position: fixed;
-            top: 0;
-            left: 0;
-            right: 0;
-            background: rgba(10, 14, 26, 0.95);
-            backdrop-filter: blur(20px);
-            border-bottom: 1px solid var(--border);
-            z-index: 100;
-            box-shadow: var(--shadow);
-            transition: transform .22s ease; will-change: transform;
-        }
-                
-        .t-mobile{ display:none; }
-        .t-desktop{ display:inline; }
-                
-        .header.hidden {
-            transform: translateY(-100%);
-        }
-        
-        .header-content {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 16px 20px;
-            text-align: center;
-            position: relative;
-        }
-                
-        /* мини-статистика уводим вправо */
-        .mini-stats{
-            position:absolute;
-            top:10px;
-            right:20px;
-
-            display:flex;
-            flex-direction:column;
-            gap:6px;
-
-            text-align:right;
-            font-size:14px;
-            opacity:.9;
-        }
-        
-        .brand {
-            margin-bottom: 12px;
-        }
-        
-        .brand h1 {
-            font-size: 1.75rem;
-            font-weight: 800;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            background-clip: text;
-            letter-spacing: -0.5px;
-            margin-bottom: 4px;
-        }
-        
-        .brand p {
-            font-size: 0.875rem;
-            color: var(--text-secondary);
-        }
-        
-        .filters {
-            display: flex;
-            gap: 8px;
-            justify-content: center;
-            flex-wrap: wrap;
-            padding: 0 10px;
-        }
-        
-        .filter-group {
-            display: flex;
-            gap: 6px;
-            background: rgba(255, 255, 255, 0.03);
-            padding: 4px;
-            border-radius: 12px;
-            border: 1px solid var(--border);
-        }
-        
-        .filter-btn {
-            padding: 8px 16px;
-            border-radius: 8px;
-            background: transparent;
-            color: var(--text-secondary);
-            border: 1px solid transparent;
-            font-size: 0.875rem;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.25s cubic-bezier(0.4, 0, 0.2, 1);
-            text-decoration: none;
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            white-space: nowrap;
-        }
-        
-        .filter-btn:hover {
-            background: var(--bg-hover);
-            color: var(--text-primary);
-            transform: translateY(-1px);
-        }
-        
-        .filter-btn.active {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border-color: rgba(255, 255, 255, 0.2);
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.3);
-        }
-        
-        /* 🚀 КНОПКА "НАВЕРХ" */
-        .scroll-to-top {
-            position: fixed;
-            bottom: 30px;
-            right: 30px;
-            width: 50px;
-            height: 50px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            border-radius: 50%;
-            font-size: 1.5rem;
-            cursor: pointer;
-            box-shadow: 0 4px 16px rgba(102, 126, 234, 0.4);
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s ease;
-            z-index: 999;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .scroll-to-top.show {
-            opacity: 1;
-            visibility: visible;
-        }
-        
-        .scroll-to-top:hover {
-            transform: translateY(-4px);
-            box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-        }
-        
-        .scroll-to-top:active {
-            transform: translateY(-2px);
-        }
-        
-        /* Контейнер */
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        
-        /* Секции */
-        .section {
-            margin-bottom: 40px;
-        }
-        
-        .section-header {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            gap: 12px;
-            margin-bottom: 20px;
-            padding-bottom: 12px;
-            border-bottom: 1px solid var(--border);
-        }
-        
-        .section-icon {
-            font-size: 1.5rem;
-        }
-        
-        .section-title {
-            font-size: 1.5rem;
-            font-weight: 700;
-            background: linear-gradient(135deg, #667eea, #764ba2);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-        }
-        
-        .section-count {
-            background: var(--accent);
-            color: white;
-            padding: 4px 12px;
-            border-radius: 20px;
-            font-size: 0.875rem;
-            font-weight: 700;
-        }
-        
-        /* Сетка карточек */
-        .games-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(280px, 1fr));
-            gap: 20px;
-        }
-        
-        /* Карточка игры */
-        .game-card {
-            background: var(--bg-card);
-            border-radius: var(--radius);
-            overflow: hidden;
-            border: 1px solid var(--border);
-            transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-            position: relative;
-        }
-        
-        .game-card:hover {
-            transform: translateY(-6px);
-            border-color: rgba(102, 126, 234, 0.4);
-            box-shadow: 0 12px 32px rgba(0, 0, 0, 0.4);
-        }
-        
-        
-        
-        /* Бейдж магазина */
-        .store-badge {
-            position: absolute;
-            top: 10px;
-            left: 10px;
-            padding: 6px 12px;
-            border-radius: 8px;
-            font-size: 0.75rem;
-            font-weight: 700;
-            text-transform: uppercase;
-            backdrop-filter: blur(10px);
-            z-index: 2;
-            letter-spacing: 0.5px;
-        }
-        
-        .store-steam { 
-            background: rgba(27, 40, 56, 0.95);
-            color: #fff;
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }
-        .store-epic { 
-            background: rgba(0, 0, 0, 0.9);
-            color: #fff;
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }
-        .store-gog { 
-            background: rgba(134, 58, 138, 0.95);
-            color: #fff;
-            border: 1px solid rgba(255, 255, 255, 0.2);
-        }
-        .store-prime { 
-            background: rgba(255, 153, 0, 0.95);
-            color: #000;
-            border: 1px solid rgba(0, 0, 0, 0.2);
-        }
-        
-        /* Изображение */
-        .game-image-container {
-            position: relative;
-            height: 150px;
-            overflow: hidden;
-            background: linear-gradient(135deg, #2d3748 0%, #4a5568 100%);
-        }
-        
-        .game-image {
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-            transition: transform 0.4s ease;
-        }
-        
-        .game-card:hover .game-image {
-            transform: scale(1.1);
-        }
-        
-        .image-placeholder {
-            width: 100%;
-            height: 100%;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            color: var(--text-muted);
-            gap: 8px;
-        }
-        
-        .image-placeholder-icon {
-            font-size: 3rem;
-            opacity: 0.6;
-        }
-        
-        /* Контент карточки */
-        .game-content {
-            padding: 16px;
-        }
-        
-        .game-title {
-            font-size: 1.05rem;
-            font-weight: 700;
-            margin-bottom: 12px;
-            line-height: 1.3;
-            color: var(--text-primary);
-            display: -webkit-box;
-            -webkit-line-clamp: 2;
-            -webkit-box-orient: vertical;
-            overflow: hidden;
-            min-height: 2.6em;
-        }
-                
-        .section { margin-top: 18px; }
-        .section-head { display:flex; align-items:flex-end; justify-content:space-between; gap:10px; margin: 10px 0 10px; }
-        .section-title { margin:0; font-size:18px; font-weight:900; }
-        .section-sub { opacity:.75; font-size:12px; }
-
-        .card.exclusive { border:1px solid rgba(255,215,0,.2); }
-        .exclusive-pill{
-            position:absolute; top:10px; right:10px;
-            padding:6px 12px; border-radius:999px;
-            background:rgba(255,215,0,.2);
-            border:1px solid rgba(255,215,0,.4);
-            font-weight:800; font-size:11px;
-            color:#ffd700;
-            text-shadow:0 1px 2px rgba(0,0,0,.3);
-        }        
-        
-        /* Теги */
-        .game-meta {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 6px;
-            margin-bottom: 12px;
-        }
-        
-        .meta-tag {
-            padding: 4px 10px;
-            border-radius: 6px;
-            font-size: 0.75rem;
-            font-weight: 700;
-            background: rgba(255, 255, 255, 0.08);
-            color: var(--text-secondary);
-            text-transform: uppercase;
-            letter-spacing: 0.3px;
-        }
-        
-        .tag-new { 
-            background: rgba(16, 185, 129, 0.2);
-            color: #10b981;
-            border: 1px solid rgba(16, 185, 129, 0.3);
-        }
-        
-        .tag-free { 
-            background: rgba(59, 130, 246, 0.2);
-            color: #3b82f6;
-            border: 1px solid rgba(59, 130, 246, 0.3);
-        }
-        
-        .tag-discount {
-            background: rgba(239, 68, 68, 0.2);
-            color: #ef4444;
-            border: 1px solid rgba(239, 68, 68, 0.3);
-        }
-        
-        /* Таймер */
-        .game-timer {
-            background: rgba(255, 255, 255, 0.05);
-            padding: 10px;
-            border-radius: 8px;
-            margin-bottom: 12px;
-            font-size: 0.85rem;
-            color: var(--text-secondary);
-            border: 1px solid var(--border);
-        }
-        
-        .timer-time {
-            font-weight: 700;
-            color: var(--text-primary);
-        }
-        
-        /* Кнопка */
-        .btn {
-            display: block;
-            width: 100%;
-            padding: 12px;
-            border-radius: 10px;
-            border: none;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            font-weight: 700;
-            font-size: 0.95rem;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            text-align: center;
-            text-decoration: none;
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.2);
-        }
-        
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(102, 126, 234, 0.4);
-        }
-        
-        .btn:active {
-            transform: translateY(0);
-        }
-        
-        /* Пустой стейт */
-        .empty-state {
-            text-align: center;
-            padding: 60px 24px;
-            background: var(--bg-card);
-            border-radius: var(--radius);
-            border: 2px dashed var(--border);
-        }
-        
-        .empty-icon {
-            font-size: 4rem;
-            margin-bottom: 20px;
-            opacity: 0.5;
-        }
-        
-        .empty-title {
-            font-size: 1.5rem;
-            margin-bottom: 8px;
-            color: var(--text-primary);
-        }
-        
-        .empty-description {
-            color: var(--text-secondary);
-        }
-        
-        /* 📱 АДАПТАЦИЯ ДЛЯ МОБИЛЬНЫХ */
-        @media (max-width: 768px) {
-            .header-content { padding: 12px 16px; }
-            .brand h1 { font-size: 1.5rem; }
-            .brand p { font-size: 0.8rem; }
-            .filters { gap: 6px; }
-            .filter-group { flex-wrap: wrap; justify-content: center; }
-            .filter-btn { padding: 6px 12px; font-size: 0.8rem; }
-            .games-grid { grid-template-columns: repeat(2, 1fr); gap: 12px; }
-            .game-image-container { height: 110px; }
-            .game-content { padding: 12px; }
-            .game-title { font-size: 0.95rem; }
-            .section-title { font-size: 1.25rem; }
-            .container { padding: 16px 12px; }
-            .scroll-to-top { width: 45px; height: 45px; bottom: 20px; right: 20px; font-size: 1.3rem; }
-            .t-mobile{ display:inline; }
-            .t-desktop{ display:none; }
-        }
-                
-       .header-content{
-  position:relative;
-  display:flex;
-  flex-direction:column;
-  align-items:center;
-}
-
-/* DESKTOP: справа сверху */
-.mini-stats{
-  position:absolute;
-  top:10px;
-  right:20px;
-
-  display:flex;
-  flex-direction:column;
-  gap:6px;
-
-  text-align:right;
-  font-size:14px;
-  opacity:.9;
-
-  background:rgba(255,255,255,.05);
-  padding:10px 14px;
-  border-radius:14px;
-  border:1px solid rgba(255,255,255,.08);
-  backdrop-filter:blur(6px);
-}
-
-/* MOBILE: превращаем в обычный блок, чтобы не перекрывал */
-@media (max-width:900px){
-  .mini-stats{
-    position:static;        /* ключевое */
-    width:100%;
-    max-width:520px;
-    margin:0 auto 12px auto;
-    text-align:center;
-  }
-}
-                 
-        /* 💻 БОЛЬШИЕ ЭКРАНЫ */
-        @media (min-width: 1400px) {
-            .games-grid {
-                grid-template-columns: repeat(4, 1fr);
-            }
-        }
-        
-        /* Анимации */
-        @keyframes fadeIn {
-            from {
-                opacity: 0;
-                transform: translateY(20px);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
-        
-        .game-card {
-            animation: fadeIn 0.4s ease-out;
-        }
-        
-        /* Плавная прокрутка */
-        html {
-            scroll-behavior: smooth;
-        }
-                
-        /* Центр и красивый лайк-блок */
-.vote-wrap{
-  display:flex;
-  justify-content:center;   /* по центру ячейки */
-  align-items:center;
-  gap:10px;
-  margin-top:10px;
-}
-
-.vote-btn{
-  display:inline-flex;
-  align-items:center;
-  justify-content:center;
-  gap:8px;
-  padding:8px 12px;
-  border:1px solid rgba(255,255,255,.12);
-  border-radius:14px;
-  background:rgba(255,255,255,.06);
-  color:inherit;
-  cursor:pointer;
-  transition:transform .08s ease, background .15s ease, border-color .15s ease;
-  user-select:none;
-}
-
-.vote-btn:hover{
-  background:rgba(255,255,255,.10);
-  border-color:rgba(255,255,255,.22);
-}
-
-.vote-btn:active{
-  transform:scale(.98);
-}
-
-.vote-ico{ font-size:18px; line-height:1; }
-.vote-count{ font-weight:700; opacity:.9; }
-
-/* подсветка выбранного */
-.vote-btn.is-active.vote-up{ background:rgba(0,255,153,.12); border-color:rgba(0,255,153,.25); }
-.vote-btn.is-active.vote-down{ background:rgba(255,80,80,.12); border-color:rgba(255,80,80,.25); }
-
-/* ===== TOUR (мини-экскурс) ===== */
-.tour-overlay{
-  position:fixed; inset:0;
-  background:rgba(0,0,0,.65);
-  z-index:9999;
-  display:none;
-}
-.tour-overlay.active{ display:block; }
-
-.tour-highlight{
-  position:relative;
-  z-index:10000;
-  border-radius:16px;
-  box-shadow:0 0 0 4px rgba(255,255,255,.15), 0 0 0 9999px rgba(0,0,0,.65);
-  transition: box-shadow .2s ease;
-}
-
-.tour-pop{
-  position:fixed;
-  z-index:10001;
-  max-width:320px;
-  background:#111827;
-  color:#e5e7eb;
-  border:1px solid rgba(255,255,255,.12);
-  border-radius:16px;
-  padding:12px 12px 10px;
-  box-shadow:0 12px 40px rgba(0,0,0,.45);
-  display:none;
-}
-.tour-pop.active{ display:block; }
-
-.tour-title{ font-weight:800; margin:0 0 6px; font-size:14px; }
-.tour-text{ margin:0 0 10px; font-size:13px; color:#cbd5e1; line-height:1.35; }
-
-.tour-actions{
-  display:flex; gap:8px; justify-content:space-between; align-items:center;
-}
-.tour-actions .left{ display:flex; gap:8px; }
-.tour-btn{
-  cursor:pointer;
-  border:1px solid rgba(255,255,255,.14);
-  background:rgba(255,255,255,.06);
-  color:#e5e7eb;
-  padding:7px 10px;
-  border-radius:12px;
-  font-size:13px;
-}
-.tour-btn.primary{
-  background:rgba(99,102,241,.25);
-  border-color:rgba(99,102,241,.45);
-}
-.tour-step{
-  font-size:12px; color:#94a3b8;
-}    
-    </style>
+    <!-- CDN картинок: DNS+TLS параллельно с разбором HTML (без crossorigin — <img> грузятся не в CORS-режиме) -->
+    <link rel="preconnect" href="https://shared.akamai.steamstatic.com">
+    <link rel="preconnect" href="https://cdn.akamai.steamstatic.com">
+    <link rel="preconnect" href="https://cdn1.epicgames.com">
+    <link rel="preconnect" href="https://images.gog-statics.com">
+    <link rel="dns-prefetch" href="//cdn.cloudflare.steamstatic.com">
+    <link rel="dns-prefetch" href="//cdn2.unrealengine.com">
+    <link rel="stylesheet" href="/static/app.css?v={{ css_version }}">
+    <script src="/static/app.js?v={{ js_version }}" defer></script>
 </head>
 <body>
     <!-- ШАПКА -->
@@ -3145,16 +3242,12 @@ PAGE = Template("""
                 <div class="game-card">
                     <div class="game-image-container">
                         <div class="store-badge store-{{ game.store }}">
-                            {% if game.store == 'steam' %}STEAM
-                            {% elif game.store == 'epic' %}EPIC
-                            {% elif game.store == 'gog' %}GOG
-                            {% elif game.store == 'prime' %}PRIME
-                            {% else %}{{ game.store|upper }}
-                            {% endif %}
+                            {{ game.store_label }}
                         </div>
                         
                         {% if game.image %}
                         <img src="{{ game.image }}" 
+                             {% if game.image_srcset %}srcset="{{ game.image_srcset }}" sizes="{{ card_img_sizes }}"{% endif %}
                              alt="{{ game.title }}"
                              class="game-image"
                              loading="lazy"
@@ -3173,12 +3266,12 @@ PAGE = Template("""
                         <div class="game-meta">
                             <span class="meta-tag tag-free">FREE GIFT 🎁</span>
                             {% if game.is_new %}
-                            <span class="meta-tag tag-new">NEW</span>
+                            <span class="meta-tag tag-new" data-created="{{ game.created_at }}">NEW</span>
                             {% endif %}
                         </div>
                         
                         {% if game.ends_at_fmt and not game.expired %}
-                        <div class="game-timer">
+                        <div class="game-timer" data-ends="{{ game.ends_at }}">
                             ⏳ До: <span class="timer-time">{{ game.ends_at_fmt }}</span>
                         </div>
                         {% endif %}
@@ -3206,16 +3299,11 @@ PAGE = Template("""
                 <div class="game-card">
                     <div class="game-image-container">
                         <div class="store-badge store-{{ game.store }}">
-                            {% if game.store == 'steam' %}STEAM
-                            {% elif game.store == 'epic' %}EPIC
-                            {% elif game.store == 'gog' %}GOG
-                            {% elif game.store == 'prime' %}PRIME 
-                            {% else %}{{ game.store|upper }}
-                            {% endif %}
+                            {{ game.store_label }}
                         </div>
                         
                         {% if game.image %}
-                        <img src="{{ game.image }}" alt="{{ game.title }}" class="game-image" loading="lazy">
+                        <img src="{{ game.image }}"{% if game.image_srcset %} srcset="{{ game.image_srcset }}" sizes="{{ card_img_sizes }}"{% endif %} alt="{{ game.title }}" class="game-image" loading="lazy">
                         {% else %}
                         <div class="image-placeholder">
                             <div class="image-placeholder-icon">🎮</div>
@@ -3228,11 +3316,11 @@ PAGE = Template("""
                         
                         <div class="game-meta">
                             <span class="meta-tag">WEEKEND</span>
-                            {% if game.is_new %}<span class="meta-tag tag-new">NEW</span>{% endif %}
+                            {% if game.is_new %}<span class="meta-tag tag-new" data-created="{{ game.created_at }}">NEW</span>{% endif %}
                         </div>
                         
                         {% if game.ends_at_fmt and not game.expired %}
-                        <div class="game-timer">
+                        <div class="game-timer" data-ends="{{ game.ends_at }}">
                             ⏳ До: <span class="timer-time">{{ game.ends_at_fmt }}</span>
                         </div>
                         {% endif %}
@@ -3323,16 +3411,11 @@ PAGE = Template("""
     <div class="game-card">
       <div class="game-image-container">
         <div class="store-badge store-{{ game.store }}">
-          {% if game.store == 'steam' %}STEAM
-          {% elif game.store == 'epic' %}EPIC
-          {% elif game.store == 'gog' %}GOG
-          {% elif game.store == 'prime' %}PRIME
-          {% else %}{{ game.store|upper }}
-          {% endif %}
+          {{ game.store_label }}
         </div>
 
         {% if game.image %}
-          <img src="{{ game.image }}" alt="{{ game.title }}" class="game-image" loading="lazy">
+          <img src="{{ game.image }}"{% if game.image_srcset %} srcset="{{ game.image_srcset }}" sizes="{{ card_img_sizes }}"{% endif %} alt="{{ game.title }}" class="game-image" loading="lazy">
         {% else %}
           <div class="image-placeholder">
             <div class="image-placeholder-icon">🎮</div>
@@ -3349,7 +3432,7 @@ PAGE = Template("""
               <span class="meta-tag tag-discount">-{{ game.discount_pct }}%</span>
             {% endif %}
             {% if game.is_new %}
-              <span class="meta-tag tag-new">NEW</span>
+              <span class="meta-tag tag-new" data-created="{{ game.created_at }}">NEW</span>
             {% endif %}
           </div>
 
@@ -3369,7 +3452,7 @@ PAGE = Template("""
         </div>
 
         {% if game.ends_at_fmt and not game.expired %}
-        <div class="game-timer">
+        <div class="game-timer" data-ends="{{ game.ends_at }}">
           ⏳ До: <span class="timer-time">{{ game.ends_at_fmt }}</span>
         </div>
         {% endif %}
@@ -3542,7 +3625,7 @@ async function submitLfg(){
                 <div class="game-card">
                     <div class="game-image-container">
                         <div class="store-badge store-{{ game.store }}">
-                            {{ game.store|upper }}
+                            {{ game.store_label }}
                         </div>
                         
                         {% if game.image_url %}
@@ -3584,89 +3667,6 @@ async function submitLfg(){
         {% endif %}
     </div>
 
-    <script>
-        // 🚀 Кнопка "Наверх"
-        const scrollBtn = document.getElementById('scrollToTop');
-        
-        // Показываем кнопку при прокрутке вниз
-        window.addEventListener('scroll', function() {
-            if (window.pageYOffset > 300) {
-                scrollBtn.classList.add('show');
-            } else {
-                scrollBtn.classList.remove('show');
-            }
-        });
-        
-        // Плавная прокрутка наверх
-        function scrollToTop() {
-            window.scrollTo({
-                top: 0,
-                behavior: 'smooth'
-            });
-        }
-    </script>
-    <script>
-(function(){
-  const header = document.querySelector(".header");
-  const btn = document.getElementById("collapseBtn");
-  if(!header) return;
-
-  let lastY = window.scrollY;
-  let ticking = false;
-
-  function applyPadding(){
-    // ✅ padding всегда равен высоте header (даже когда hidden)
-    // иначе появляются "прыжки" и "пустота"
-    document.body.style.paddingTop = header.offsetHeight + "px";
-  }
-
-  // старт / resize
-  applyPadding();
-  window.addEventListener("resize", () => requestAnimationFrame(applyPadding));
-
-  // collapse toggle
-  if(btn){
-    btn.addEventListener("click", () => {
-      header.classList.toggle("collapsed");
-      btn.textContent = header.classList.contains("collapsed") ? "Фильтры ▼" : "Свернуть ▲";
-      requestAnimationFrame(applyPadding);
-    });
-  }
-
-  function onScroll(){
-    const y = window.scrollY;
-
-    // верх страницы — всегда показываем
-    if (y < 30){
-      header.classList.remove("hidden");
-      lastY = y;
-      return;
-    }
-
-    // вниз — прячем, вверх — показываем
-    if (y > lastY + 12){
-      header.classList.add("hidden");
-    } else if (y < lastY - 12){
-      header.classList.remove("hidden");
-    }
-
-    lastY = y;
-  }
-
-  window.addEventListener("scroll", () => {
-    if(!ticking){
-      requestAnimationFrame(() => {
-        onScroll();
-        ticking = false;
-      });
-      ticking = true;
-    }
-  }, { passive:true });
-
-  // если шрифт/контент в header догрузился и высота изменилась
-  setTimeout(applyPadding, 200);
-})();
-</script>
 <script>
 async function vote(dealId, v, root){
   try{
@@ -3881,7 +3881,7 @@ if ("serviceWorker" in navigator) {
 </html>
 """)
 
-DEAL_PAGE = Template("""
+DEAL_PAGE = compile_template("deal", """
 <!doctype html>
 <html lang="ru">
 <head>
@@ -3928,19 +3928,88 @@ DEAL_PAGE = Template("""
 """)
 
 from fastapi.staticfiles import StaticFiles
-app.mount("/static", StaticFiles(directory="/opt/freerg/static"), name="static")
 
-@app.get("/d/{deal_id}", response_class=HTMLResponse)
-def deal_page(deal_id: str, request: Request):
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles + вечный кэш для версионированных ссылок (/static/app.css?v=...)."""
+
+    async def get_response(self, path, scope):
+        resp = await super().get_response(path, scope)
+        if resp.status_code == 200 and b"v=" in scope.get("query_string", b""):
+            resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return resp
+
+
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
+
+DEAL_META_CACHE_SIZE = 2048
+# LRU только по существующим id: несуществующие не кэшируем, иначе запросы
+# со случайными id вытесняли бы горячие раздачи
+_DEAL_META: "OrderedDict[str, tuple]" = OrderedDict()
+_DEAL_META_LOCK = threading.Lock()
+
+
+def deal_meta_cached(deal_id: str) -> tuple | None:
+    """Только память, без БД — можно звать прямо из цикла событий."""
+    with _DEAL_META_LOCK:
+        meta = _DEAL_META.get(deal_id)
+        if meta is not None:
+            _DEAL_META.move_to_end(deal_id)
+        return meta
+
+
+def deal_meta_cache_clear() -> None:
+    with _DEAL_META_LOCK:
+        _DEAL_META.clear()
+
+
+def deal_meta(deal_id: str) -> tuple | None:
+    """
+    (store, kind, title, url, image_url, ends_at) по id — одни и те же раздачи
+    открывают снова и снова. Кэш сбрасывается в invalidate_page_cache().
+    """
+    meta = deal_meta_cached(deal_id)
+    if meta is not None:
+        return meta
+
     conn = db()
     row = conn.execute("""
         SELECT store, kind, title, url, image_url, ends_at
         FROM deals
         WHERE id=? LIMIT 1
     """, (deal_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+
+    meta = tuple(row)
+    with _DEAL_META_LOCK:
+        _DEAL_META[deal_id] = meta
+        if len(_DEAL_META) > DEAL_META_CACHE_SIZE:
+            _DEAL_META.popitem(last=False)
+    return meta
+
+
+def warm_deal_meta(limit: int = 50) -> None:
+    """Прогрев deal_meta самыми кликаемыми раздачами за неделю."""
+    conn = db()
+    rows = conn.execute("""
+        SELECT deal_id FROM clicks
+        WHERE created_at >= ?
+        GROUP BY deal_id
+        ORDER BY COUNT(*) DESC
+        LIMIT ?
+    """, ((datetime.utcnow() - timedelta(days=7)).isoformat(), limit)).fetchall()
+    conn.close()
+    for (did,) in rows:
+        deal_meta(did)
+
+
+@app.get("/d/{deal_id}", response_class=HTMLResponse)
+def deal_page(deal_id: str, request: Request):
+    row = deal_meta(deal_id)
 
     if not row:
-        conn.close()
         return HTMLResponse("<h3 style='font-family:system-ui'>Deal not found</h3><p><a href='/'>Back</a></p>", status_code=404)
 
     st, kind, title, url, image_url, ends_at = row
@@ -3953,12 +4022,12 @@ def deal_page(deal_id: str, request: Request):
     # (cookie уже появится через /go или /out)
     # Если хочешь ставить cookie и тут — скажи, сделаем через HTMLResponse + set_cookie.
     if request.query_params.get("src") is None:
+        conn = db()
         try:
             log_click(conn, deal_id, request, src="card")
         except Exception:
             pass
-
-    conn.close()
+        conn.close()
 
     return DEAL_PAGE.render(
         title=title,
@@ -3970,10 +4039,23 @@ def deal_page(deal_id: str, request: Request):
     )
 
 
+STORE_BADGES = {"steam": "🎮 Steam", "epic": "🟦 Epic", "gog": "🟪 GOG", "prime": "🟨 Prime"}
+
+
 def store_badge(store: str | None) -> str:
-    return {"steam": "🎮 Steam", "epic": "🟦 Epic", "gog": "🟪 GOG", "prime": "🟨 Prime"}.get(store or "", store or "Store")
+    return STORE_BADGES.get(store or "", store or "Store")
+
+
+# подпись на плашке карточки главной (раньше — if/elif цепочка в шаблоне)
+STORE_LABELS = {"steam": "STEAM", "epic": "EPIC", "gog": "GOG", "prime": "PRIME"}
+
+
+def store_label(store: str | None) -> str:
+    st = (store or "").strip().lower()
+    return STORE_LABELS.get(st) or st.upper()
 
 
+@functools.lru_cache(maxsize=8192)  # чистая функция от (store, url, image_url)
 def images_for_row(row_store: str | None, url: str, image_url: str | None):
     """Правильное извлечение изображений"""
     st = (str(row_store) or "").strip().lower()
@@ -3991,19 +4073,216 @@ def images_for_row(row_store: str | None, url: str, image_url: str | None):
     
     # 4. Если нашли - генерируем URL
     if appid:
-        main = f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{appid}/header.jpg"
+        main = f"{STEAM_ASSETS_BASE}{appid}/header.jpg"
         fallback = f"https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/header.jpg"
         return main, fallback
     
     return "", ""
 
+
+STEAM_ASSETS_BASE = "https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/"
+# карточки: на мобиле 2 колонки (~50vw), на десктопе не шире header.jpg
+CARD_IMG_SIZES = "(max-width: 768px) 50vw, 460px"
+
+
+def steam_srcset(img: str) -> str:
+    """header.jpg (460w) + capsule_231x87.jpg (231w) для Steam-картинок, иначе ""."""
+    if not (img.startswith(STEAM_ASSETS_BASE) and img.endswith("/header.jpg")):
+        return ""
+    return f"{img[:-len('header.jpg')]}capsule_231x87.jpg 231w, {img} 460w"
+
+# "Обновлено: ..." на главной — строка меняется раз в минуту, strftime зовём так же
+_LAST_UPDATE = [0, ""]
+
+
+def last_update_label() -> str:
+    minute = int(time.time() // 60)
+    if minute != _LAST_UPDATE[0]:
+        _LAST_UPDATE[:] = [minute, datetime.now().strftime("%d.%m.%Y %H:%M")]
+    return _LAST_UPDATE[1]
+
+
+HOT_TOTAL = 20   # витрина Hot Deals на главной
+HOT_90 = 6
+HOT_70_89 = 14
+
+# keep/weekend одним round-trip; колонка bucket говорит, куда строка.
+# Колонки после bucket те же, что у HOT_DEALS_SQL (у keep/weekend цены NULL).
+# Фильтры магазина/времени (как is_active_end: без дедлайна или битый — активен)
+# тоже в SQL, чтобы не тащить в Python строки, которые выкинем. Берём 150 свежих,
+# а сортировку по дедлайну (без дедлайна/битые — в конец) делает SQLite:
+# julianday понимает и "Z", и "+00:00".
+# "Недавно истёкшие" (show_expired) — тоже от julianday('now'), а не по флагу
+# is_expired_recent: refresh_deal_flags пересчитывает его раз в час, и раздача,
+# закончившаяся после пересчёта, пропадала бы из обоих видов. Флаг — только для показа.
+INDEX_FILTERS_SQL = """
+          (:store = 'all' OR lower(trim(store)) = :store)
+          AND (julianday(ends_at) IS NULL
+               OR julianday(ends_at) > julianday('now')
+               OR (:show_expired AND julianday(ends_at) >= julianday('now', '-7 days')))
+"""
+INDEX_DEALS_SQL = """
+    SELECT * FROM (
+    SELECT * FROM (
+        SELECT 'keep' AS bucket, id, store, title, url, image_url, ends_at, created_at,
+               is_new, is_expired_recent, NULL, NULL, NULL, NULL
+        FROM deals
+        WHERE kind='free_to_keep' AND {filters}
+        ORDER BY created_at DESC LIMIT 150
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'weekend', id, store, title, url, image_url, ends_at, created_at,
+               is_new, is_expired_recent, NULL, NULL, NULL, NULL
+        FROM deals
+        WHERE kind='free_weekend' AND {filters}
+        ORDER BY created_at DESC LIMIT 150
+    )
+    )
+    ORDER BY bucket, julianday(ends_at) IS NULL, julianday(ends_at), created_at DESC
+""".format(filters=INDEX_FILTERS_SQL)
+
+HOT_DEALS_SQL = """
+    SELECT id, store, title, url, image_url, ends_at, created_at,
+           is_new, is_expired_recent, discount_pct, price_old, price_new, currency
+    FROM deals WHERE id IN ({})
+    ORDER BY julianday(ends_at) IS NULL, julianday(ends_at)
+"""
+
+# id горячих скидок по корзинам (90+ / 70-89), чтобы не гонять ORDER BY RANDOM()
+# по всей таблице на каждый рендер. Сбрасывается вместе с кэшем страницы.
+_HOT_IDS: dict[int, list[str]] | None = None
+
+
+def hot_deal_ids(conn) -> dict[int, list[str]]:
+    global _HOT_IDS
+    if _HOT_IDS is None:
+        ids: dict[int, list[str]] = {90: [], 70: []}
+        for did, pct in conn.execute(
+            "SELECT id, discount_pct FROM deals WHERE kind='hot_deal' AND discount_pct >= 70"
+        ):
+            ids[90 if pct >= 90 else 70].append(did)
+        _HOT_IDS = ids
+    return _HOT_IDS
+
+
+def pick_hot_ids(conn) -> list[str]:
+    """6 id со скидкой 90%+ и 14 с 70-89%; если корзины не хватает — добиваем из другой."""
+    ids = hot_deal_ids(conn)
+    h90, h70 = ids[90], ids[70]
+    picked = random.sample(h90, min(HOT_90, len(h90))) + random.sample(h70, min(HOT_70_89, len(h70)))
+    if len(picked) < HOT_TOTAL:
+        taken = set(picked)
+        rest = [did for did in h90 + h70 if did not in taken]
+        picked += random.sample(rest, min(HOT_TOTAL - len(picked), len(rest)))
+    return picked
+
+
+class DealCard(NamedTuple):
+    """
+    Карточка витрины (keep / weekend / hot). Кортеж вместо dict на 15-20 ключей:
+    меньше памяти на строку, а game.title в шаблоне — прямой getattr.
+    """
+    id: str
+    store: str
+    store_label: str
+    title: str
+    url: str
+    image: str | None
+    image_fallback: str | None
+    image_srcset: str
+    ends_at: str | None
+    ends_dt: datetime | None
+    is_new: bool
+    ends_at_fmt: str
+    created_at: str
+    expired: bool
+    go_url: str
+    # только у hot deals
+    discount_pct: int | None = None
+    price_old: float | None = None
+    price_new: float | None = None
+    currency: str | None = None
+    price_old_fmt: str | None = None
+    price_new_fmt: str | None = None
+    currency_sym: str | None = None
+
+
+# готовый HTML главной по (store, kind, show_expired): deals меняются раз в минуты,
+# а не на каждый запрос. Любая запись в deals/lfg/manual_news сбрасывает кэш.
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "45"))
+# значение: (время рендера, html, gzip, brotli|None, etag) — сжимаем один раз на поколение кэша
+_PAGE_CACHE: dict[tuple, tuple[float, str, bytes, bytes | None, str]] = {}
+# поколение данных главной: +1 на каждый invalidate_page_cache(). Рендер запоминает
+# его в начале и не кладёт HTML в кэш, если данные успели смениться
+_PAGE_GEN = 0
+BROTLI_QUALITY = 11
+# браузер/CDN держат главную минуту и ещё 5 минут могут отдавать старую, обновляясь в фоне
+PAGE_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+
+
+def compressed_page(html: str) -> tuple[bytes, bytes | None]:
+    raw = html.encode("utf-8")
+    gz = gzip.compress(raw, compresslevel=9)
+    br = brotli.compress(raw, quality=BROTLI_QUALITY) if brotli is not None else None
+    return gz, br
+
+
+def fill_page_cache(cache_key: tuple, parts: list, gen: int) -> None:
+    # HEAD / оборванное соединение — страница не дорендерена, такое не кэшируем
+    if not parts or parts[-1] is not None:
+        return
+    # пока стримили, кэш сбросили — этот HTML уже устарел
+    if gen != _PAGE_GEN:
+        return
+    html = "".join(parts[:-1])
+    # weak ETag от самого HTML: одно значение на gzip/br/identity-варианты. Страница
+    # меняется и от часов (истёкшие раздачи/LFG, "обновлено N мин назад"),
+    # так что версия данных для ETag не годится
+    etag = 'W/"' + hashlib.sha1(html.encode("utf-8")).hexdigest()[:16] + '"'
+    _PAGE_CACHE[cache_key] = (time.monotonic(), html, *compressed_page(html), etag)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match — список через запятую; сравнение слабое (W/ не важен)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == opaque for t in if_none_match.split(","))
+
+
+def page_response(entry: tuple, request: Request) -> Response:
+    """Отдаём уже сжатую версию, если клиент её понимает."""
+    _, html, gz, br, etag = entry
+    headers = {"Vary": "Accept-Encoding", "ETag": etag, "Cache-Control": PAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    accept = request.headers.get("accept-encoding", "")
+    if br is not None and "br" in accept:
+        headers["Content-Encoding"] = "br"
+        return Response(br, media_type="text/html; charset=utf-8", headers=headers)
+    if "gzip" in accept:
+        headers["Content-Encoding"] = "gzip"
+        return Response(gz, media_type="text/html; charset=utf-8", headers=headers)
+    return HTMLResponse(html, headers=headers)
+
+
+def invalidate_page_cache() -> None:
+    global _HOT_IDS, _PAGE_GEN
+    _PAGE_GEN += 1
+    _PAGE_CACHE.clear()
+    _HOT_IDS = None
+    deal_meta_cache_clear()
+
+
 @app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
 # ИСПРАВЛЕННАЯ ФУНКЦИЯ INDEX()
 # Замени с строки 3583 до строки 3879
 
-def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
-    conn = db()
-    
+def index(request: Request, show_expired: int = 0, store: str = "all", kind: str = "all"):
     # Нормализация параметров
     store = (store or "all").strip().lower()
     if store not in {"all", "steam", "epic", "gog", "prime"}:
@@ -4012,90 +4291,45 @@ def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
     kind = (kind or "all").strip().lower()
     if kind not in {"all", "keep", "weekend", "free", "deals"}:
         kind = "all"
-    
-    # ===== ФУНКЦИИ ФИЛЬТРАЦИИ =====
-    def allow_time(ends_at: str | None) -> bool:
-        if is_active_end(ends_at):
-            return True
-        return bool(show_expired) and is_expired_recent(ends_at, days=7)
-    
-    def allow_store(row_store: str | None) -> bool:
-        if store == "all":
-            return True
-        return (row_store or "").strip().lower() == store
-    
+
+    show_expired = 1 if show_expired else 0
+
+    cache_key = (store, kind, show_expired)
+    cached = _PAGE_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < PAGE_CACHE_TTL:
+        return page_response(cached, request)
+
+    # поколение — до чтения БД: запись во время рендера его сменит
+    gen = _PAGE_GEN
+
+    conn = db()
+
+    # одно "сейчас" на весь рендер, а не datetime.now() на каждую строку
+    now = datetime.now(timezone.utc)
+
     # ===== ПОЛУЧАЕМ ДАННЫЕ ИЗ БД =====
     
-    # Free to Keep
-    keep_rows = conn.execute("""
-        SELECT id, store, title, url, image_url, ends_at, created_at
-        FROM deals
-        WHERE kind='free_to_keep'
-        ORDER BY created_at DESC
-        LIMIT 150
-    """).fetchall()
-    
-    # Free Weekend
-    weekend_rows = conn.execute("""
-        SELECT id, store, title, url, image_url, ends_at, created_at
-        FROM deals
-        WHERE kind='free_weekend'
-        ORDER BY created_at DESC
-        LIMIT 150
-    """).fetchall()
-    
-    # Hot Deals (витрина 20 игр: 6x90%+ и 14x70-89%)
-    HOT_TOTAL = 20
-    HOT_90 = 6
-    HOT_70_89 = 14
-    
+    # Free to Keep + Free Weekend — одним запросом
+    keep_rows, weekend_rows = [], []
+    buckets = {"keep": keep_rows, "weekend": weekend_rows}
+    params = {"store": store, "show_expired": show_expired}
+    for bucket, *row in conn.execute(INDEX_DEALS_SQL, params):
+        buckets[bucket].append(row)
+
+    # Hot Deals (витрина 20 игр: 6x90%+ и 14x70-89%): id выбираем в Python, строки — одним IN
     hot_rows = []
-    
-    # 1) Скидки 90%+
-    hot_rows += conn.execute("""
-        SELECT id, store, title, url, image_url, ends_at, created_at,
-               discount_pct, price_old, price_new, currency
-        FROM deals
-        WHERE kind='hot_deal' AND discount_pct >= 90
-        ORDER BY RANDOM()
-        LIMIT ?
-    """, (HOT_90,)).fetchall()
-    
-    # 2) Скидки 70-89%
-    hot_rows += conn.execute("""
-        SELECT id, store, title, url, image_url, ends_at, created_at,
-               discount_pct, price_old, price_new, currency
-        FROM deals
-        WHERE kind='hot_deal' AND discount_pct BETWEEN 70 AND 89
-        ORDER BY RANDOM()
-        LIMIT ?
-    """, (HOT_70_89,)).fetchall()
-    
-    # 3) Фоллбек если мало
-    if len(hot_rows) < HOT_TOTAL:
-        need = HOT_TOTAL - len(hot_rows)
-        hot_rows += conn.execute("""
-            SELECT id, store, title, url, image_url, ends_at, created_at,
-                   discount_pct, price_old, price_new, currency
-            FROM deals
-            WHERE kind='hot_deal' AND discount_pct >= 70
-            ORDER BY RANDOM()
-            LIMIT ?
-        """, (need,)).fetchall()
-    
-    # Убираем дубли
-    uniq = {}
-    for r in hot_rows:
-        uniq[r[0]] = r
-    hot_rows = list(uniq.values())[:HOT_TOTAL]
-    
+    hot_ids = pick_hot_ids(conn)
+    if hot_ids:
+        sql = HOT_DEALS_SQL.format(",".join("?" * len(hot_ids)))
+        hot_rows = conn.execute(sql, hot_ids)
+
     # Free Games (F2P)
     free_games_rows = conn.execute("""
         SELECT store, title, url, image_url, note
         FROM free_games
         ORDER BY sort ASC, created_at DESC
         LIMIT 24
-    """).fetchall()
+    """)
     
     # LFG заявки
     lfg_rows = conn.execute("""
@@ -4105,7 +4339,7 @@ def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
           AND (expires_at IS NULL OR expires_at > ?)
         ORDER BY created_at DESC
         LIMIT 12
-    """, (datetime.utcnow().isoformat(),)).fetchall()
+    """, (datetime.utcnow().isoformat(),))
     
     # Manual News (Эксклюзивы)
     manual_rows = conn.execute("""
@@ -4115,99 +4349,53 @@ def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
         WHERE is_published=1
         ORDER BY datetime(created_at) DESC
         LIMIT 12
-    """).fetchall()
-    
-    conn.close()
+    """)
+
+    # дальше строки читаем прямо из курсоров, без промежуточных fetchall()-списков;
+    # соединение закрываем, когда всё вычитано
     
     # ===== ОБРАБАТЫВАЕМ ДАННЫЕ =====
     
-    # Keep
-    keep = []
-    for r in keep_rows:
-        did, st, title, url, image_url, ends_at, created_at = r
-        
-        if not (allow_time(ends_at) and allow_store(st)):
-            continue
-        
-        img_main, img_fb = images_for_row(st, url, image_url)
-        
-        keep.append({
-            "id": did,
-            "store": (st or "").strip().lower(),
-            "store_badge": store_badge(st),
-            "title": title,
-            "url": url,
-            "image": img_main,
-            "image_fallback": img_fb,
-            "ends_at": ends_at,
-            "is_new": is_new(created_at),
-            "ends_at_fmt": format_expiry(ends_at) if ends_at else "",
-            "created_at": created_at,
-            "expired": not is_active_end(ends_at),
-            "time_left": time_left_label(ends_at),
-            "go_url": f"{SITE_BASE}/go/{did}?src=site&utm_campaign=freeredeemgames&utm_content=keep",
-        })
-    
-    # Weekend
-    weekend = []
-    for r in weekend_rows:
-        did, st, title, url, image_url, ends_at, created_at = r
-        
-        if not (allow_time(ends_at) and allow_store(st)):
-            continue
-        
-        img_main, img_fb = images_for_row(st, url, image_url)
-        
-        weekend.append({
-            "id": did,
-            "store": (st or "").strip().lower(),
-            "store_badge": store_badge(st),
-            "title": title,
-            "url": url,
-            "image": img_main,
-            "image_fallback": img_fb,
-            "ends_at": ends_at,
-            "is_new": is_new(created_at),
-            "ends_at_fmt": format_expiry(ends_at) if ends_at else "",
-            "created_at": created_at,
-            "expired": not is_active_end(ends_at),
-            "time_left": time_left_label(ends_at),
-            "go_url": f"{SITE_BASE}/go/{did}?src=site&utm_campaign=freeredeemgames&utm_content=weekend",
-        })
-    
-    # Hot Deals
-    hot = []
-    for r in hot_rows:
-        did, st, title, url, image_url, ends_at, created_at, discount_pct, price_old, price_new, currency = r
-        
-        if not allow_store(st):
-            continue
-        
-        img_main, img_fb = images_for_row(st, url, image_url)
-        
-        hot.append({
-            "id": did,
-            "store": (st or "").strip().lower(),
-            "store_badge": store_badge(st),
-            "title": title,
-            "url": url,
-            "image": img_main,
-            "image_fallback": img_fb,
-            "ends_at": ends_at,
-            "is_new": is_new(created_at),
-            "ends_at_fmt": format_expiry(ends_at) if ends_at else "",
-            "created_at": created_at,
-            "expired": not is_active_end(ends_at),
-            "time_left": time_left_label(ends_at),
-            "discount_pct": discount_pct,
-            "price_old": price_old,
-            "price_new": price_new,
-            "currency": currency,
-            "price_old_fmt": fmt_price(price_old),
-            "price_new_fmt": fmt_price(price_new),
-            "currency_sym": currency_symbol(currency),
-            "go_url": f"{SITE_BASE}/go/{did}?src=site&utm_campaign=freeredeemgames&utm_content=deals",
-        })
+    # Keep / Weekend / Hot Deals — один проход: строки у всех трёх одной формы
+    keep, weekend, hot = [], [], []
+    sections = (
+        (keep, keep_rows, GO_URL_TAIL + "keep"),
+        (weekend, weekend_rows, GO_URL_TAIL + "weekend"),
+        (hot, hot_rows, GO_URL_TAIL + "deals"),
+    )
+    for out, rows, go_tail in sections:
+        is_hot = out is hot
+        for r in rows:
+            (did, st, title, url, image_url, ends_at, created_at, new_flag, expired_recent,
+             discount_pct, price_old, price_new, currency) = r
+
+            st = (st or "").strip().lower()
+            # keep/weekend уже отфильтрованы в INDEX_DEALS_SQL, hot — нет
+            if is_hot and store != "all" and st != store:
+                continue
+
+            # ends_at разбираем один раз на строку: дальше и is_active_end,
+            # и подсчёт expiring_soon берут готовый datetime
+            ends_dt = parse_iso_utc_cached(ends_at)
+            active = is_active_end(ends_dt, now)
+
+            img_main, img_fb = images_for_row(st, url, image_url)
+
+            # цены — только у hot deals, у keep/weekend поля остаются None
+            price = (
+                discount_pct, price_old, price_new, currency,
+                fmt_price(price_old), fmt_price(price_new), currency_symbol(currency),
+            ) if is_hot else ()
+
+            out.append(DealCard(
+                did, st, store_label(st), title, url,
+                img_main, img_fb, steam_srcset(img_main),
+                ends_at, ends_dt, bool(new_flag),
+                format_expiry(ends_at) if ends_at else "",
+                created_at, not active,
+                GO_URL_PREFIX + did + go_tail,
+                *price,
+            ))
     
     # LFG
     lfg = []
@@ -4255,32 +4443,34 @@ def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
         
         free_games.append({
             "store": st_norm,
-            "store_badge": store_badge(st_norm),
+            "store_label": store_label(st_norm),
             "title": title,
             "url": url,
             "image_url": img,
             "note": note,
             "go_url": url,  # F2P идёт напрямую в магазин
         })
-    
-    # Сортируем по дате окончания
-    keep.sort(key=lambda d: sort_key_by_ends(d["ends_at"]))
-    weekend.sort(key=lambda d: sort_key_by_ends(d["ends_at"]))
-    hot.sort(key=lambda d: sort_key_by_ends(d["ends_at"]))
+
+    stats = calc_savings(conn)
+    conn.close()
     
     # Статистика
     total_games = len(keep) + len(weekend) + len(hot)
-    new_today = sum(1 for g in (keep + weekend + hot) if g.get("is_new"))
-    expiring_soon = sum(
-        1 for g in (keep + weekend)
-        if g.get("time_left") and ("час" in g.get("time_left", "") or "мин" in g.get("time_left", ""))
-    )
-    last_update = datetime.now().strftime("%d.%m.%Y %H:%M")
-    
-    stats = calc_savings(db())
+    new_today = sum(1 for g in (keep + weekend + hot) if g.is_new)
+    # "осталось N мин" — меньше часа до конца
+    soon = now + timedelta(hours=1)
+    expiring_soon = 0
+    for g in keep + weekend:
+        dt = g.ends_dt
+        if dt and now < dt <= soon:
+            expiring_soon += 1
+    last_update = last_update_label()
     
     # Рендерим страницу
-    return PAGE.render(
+    ctx = dict(
+        css_version=CSS_VERSION,
+        js_version=JS_VERSION,
+        card_img_sizes=CARD_IMG_SIZES,
         keep=keep,
         weekend=weekend,
         hot=hot,
@@ -4301,22 +4491,24 @@ def index(show_expired: int = 0, store: str = "all", kind: str = "all"):
         manual=manual_items,
     )
 
-# Вспомогательная функция для сборки словаря (чтобы не дублировать код)
-def build_item_dict(r, img, fb, content_type):
-    return {
-        "id": r['id'],
-        "store": (r['store'] or "").lower(),
-        "title": r['title'],
-        "url": r['url'],
-        "image": img,
-        "image_fallback": fb,
-        "ends_at": r['ends_at'],
-        "is_new": is_new(r['created_at']),
-        "ends_at_fmt": format_expiry(r['ends_at']) if r['ends_at'] else "",
-        "expired": not is_active_end(r['ends_at']),
-        "time_left": time_left_label(r['ends_at']),
-        "go_url": f"{SITE_BASE}/go/{r['id']}?src=site&content={content_type}"
-    }
+    # промах кэша: отдаём HTML по мере рендера (<head> с preconnect уходит сразу),
+    # а сжатие и запись в кэш — уже после ответа
+    parts: list = []
+
+    def generate():
+        for chunk in PAGE.generate(**ctx):
+            parts.append(chunk)
+            yield chunk
+        parts.append(None)  # метка "дорендерили до конца"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/html; charset=utf-8",
+        # ETag — хэш готового HTML, он появится у ответов из кэша;
+        # 304 отдаёт только page_response() по живой записи
+        headers={"Vary": "Accept-Encoding", "Cache-Control": PAGE_CACHE_CONTROL},
+        background=BackgroundTask(fill_page_cache, cache_key, parts, gen),
+    )
 
 from fastapi import Form, Request
 
@@ -4536,6 +4728,7 @@ def lfg_create_api(payload: LfgCreate, request: Request):
         ip,
     ))
     conn.commit()
+    invalidate_page_cache()
 
     # Логируем создание
     try:
@@ -4571,6 +4764,7 @@ def lfg_create(payload: LfgCreate, request: Request):
         ua
     ))
     conn.commit()
+    invalidate_page_cache()
     conn.close()
 
     return {"ok": True, "id": lfg_id}
@@ -4665,9 +4859,7 @@ def go_lfg(
 # --------------------
 
 @app.get("/go/{deal_id}")
-def go_deal(deal_id: str, request: Request):
-    conn = db()
-
+async def go_deal(deal_id: str, request: Request):
     src = request.query_params.get("src") or "tg"
     utm_campaign = request.query_params.get("utm_campaign")
     utm_content = request.query_params.get("utm_content")
@@ -4677,13 +4869,12 @@ def go_deal(deal_id: str, request: Request):
     # ставим cookie тут
     vid = get_or_set_vid(request, resp)
 
-    log_click(conn, deal_id, request,
-              src=src,
-              utm_campaign=utm_campaign,
-              utm_content=utm_content,
-              visitor_id=vid)
-
-    conn.close()
+    # в БД запишет click_writer (см. CLICK_QUEUE)
+    CLICK_QUEUE.put_nowait(click_row(deal_id, request,
+                                     src=src,
+                                     utm_campaign=utm_campaign,
+                                     utm_content=utm_content,
+                                     visitor_id=vid))
     return resp
 
 @app.api_route("/health", methods=["GET", "HEAD"])
@@ -4695,7 +4886,7 @@ def health():
 def debug_tg():
     return {"bot_token_present": bool(TG_BOT_TOKEN), "chat_id": TG_CHAT_ID}
 
-STATS_PAGE = Template("""
+STATS_PAGE = compile_template("stats", """
 <!doctype html>
 <html lang="ru">
 <head>
@@ -4847,6 +5038,14 @@ def require_basic(credentials: HTTPBasicCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Basic"},
         )
 
+# (клики за окно, клики за сутки): окно days >= 1, так что сутки — его хвост
+CLICKS_TOTALS_SQL = """
+    SELECT COUNT(*), COALESCE(SUM(created_at >= ?), 0)
+    FROM clicks
+    WHERE created_at >= ?
+"""
+
+
 @app.get("/stats_html", response_class=HTMLResponse, dependencies=[Depends(require_basic)])
 def stats_html(days: int = 7, top: int = 15):
     if days < 1: days = 1
@@ -4854,98 +5053,20 @@ def stats_html(days: int = 7, top: int = 15):
     if top < 1: top = 1
     if top > 50: top = 50
 
-    conn = db()
-
-    clicks_total = conn.execute("""
-        SELECT COUNT(*) FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-    """, (f"-{days} days",)).fetchone()[0]
-        # уникальные пользователи (visitor_id) за диапазон
-    users_total = conn.execute("""
-        SELECT COUNT(DISTINCT visitor_id)
-        FROM clicks
-        WHERE visitor_id IS NOT NULL
-          AND datetime(created_at) >= datetime('now', ?)
-          AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-    """, (f"-{days} days",)).fetchone()[0]
-
-    # returning: был ДО начала окна
-    users_returning = conn.execute("""
-        WITH in_range AS (
-          SELECT DISTINCT visitor_id
-          FROM clicks
-          WHERE visitor_id IS NOT NULL
-            AND datetime(created_at) >= datetime('now', ?)
-            AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-        )
-        SELECT COUNT(*)
-        FROM in_range r
-        WHERE EXISTS (
-          SELECT 1 FROM clicks c
-          WHERE c.visitor_id = r.visitor_id
-            AND datetime(c.created_at) < datetime('now', ?)
-        )
-    """, (f"-{days} days", f"-{days} days")).fetchone()[0]
-
-    users_new = max(users_total - users_returning, 0)
-    returning_rate = (users_returning / users_total) if users_total else 0.0
-
-    # пики по часам (по Бишкеку +6)
-    hours = conn.execute("""
-        SELECT strftime('%H', datetime(created_at, '+6 hours')) as h, COUNT(*) cnt
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-          AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-        GROUP BY h
-        ORDER BY h
-    """, (f"-{days} days",)).fetchall()
-    hour_map = {h: c for h, c in hours}
-    hour_series = [{"h": f"{i:02d}", "c": int(hour_map.get(f"{i:02d}", 0))} for i in range(24)]
-    hour_max = max([x["c"] for x in hour_series], default=1)
-
-    # TG форматы: tg->out по utm_content
-    fmt_rows = conn.execute("""
-        WITH tg AS (
-          SELECT COALESCE(utm_content,'') fmt, COUNT(*) cnt
-          FROM clicks
-          WHERE src='tg' AND datetime(created_at) >= datetime('now', ?)
-          GROUP BY fmt
-        ),
-        out AS (
-          SELECT COALESCE(utm_content,'') fmt, COUNT(*) cnt
-          FROM clicks
-          WHERE src='out' AND datetime(created_at) >= datetime('now', ?)
-          GROUP BY fmt
-        )
-        SELECT tg.fmt, tg.cnt tg_clicks, COALESCE(out.cnt,0) out_clicks
-        FROM tg
-        LEFT JOIN out ON out.fmt = tg.fmt
-        ORDER BY (1.0*COALESCE(out.cnt,0)/tg.cnt) DESC, tg_clicks DESC
-        LIMIT 12
-    """, (f"-{days} days", f"-{days} days")).fetchall()
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    day_ago = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    conn = db_read()
 
-    formats = []
-    for fmt, tg_clicks, out_clicks in fmt_rows:
-        conv = (out_clicks / tg_clicks) if tg_clicks else 0.0
-        formats.append({
-            "fmt": fmt or "(empty)",
-            "tg": tg_clicks,
-            "out": out_clicks,
-            "conv": round(conv, 3)
-        })
+    clicks_total, clicks_24h = conn.execute(CLICKS_TOTALS_SQL, (day_ago, since)).fetchone()
 
-    clicks_24h = conn.execute("""
-        SELECT COUNT(*) FROM clicks
-        WHERE datetime(created_at) >= datetime('now', '-1 day')
-    """).fetchone()[0]
-        # уникальные пользователи (visitor_id) за диапазон
+    # уникальные пользователи (visitor_id) за диапазон
     users_total = conn.execute("""
         SELECT COUNT(DISTINCT visitor_id)
         FROM clicks
         WHERE visitor_id IS NOT NULL
-          AND datetime(created_at) >= datetime('now', ?)
+          AND created_at >= ?
           AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-    """, (f"-{days} days",)).fetchone()[0]
+    """, (since,)).fetchone()[0]
 
     # returning: был ДО начала окна
     users_returning = conn.execute("""
@@ -4953,7 +5074,7 @@ def stats_html(days: int = 7, top: int = 15):
           SELECT DISTINCT visitor_id
           FROM clicks
           WHERE visitor_id IS NOT NULL
-            AND datetime(created_at) >= datetime('now', ?)
+            AND created_at >= ?
             AND COALESCE(user_agent,'') NOT LIKE '%bot%'
         )
         SELECT COUNT(*)
@@ -4961,9 +5082,9 @@ def stats_html(days: int = 7, top: int = 15):
         WHERE EXISTS (
           SELECT 1 FROM clicks c
           WHERE c.visitor_id = r.visitor_id
-            AND datetime(c.created_at) < datetime('now', ?)
+            AND c.created_at < ?
         )
-    """, (f"-{days} days", f"-{days} days")).fetchone()[0]
+    """, (since, since)).fetchone()[0]
 
     users_new = max(users_total - users_returning, 0)
     returning_rate = (users_returning / users_total) if users_total else 0.0
@@ -4972,35 +5093,29 @@ def stats_html(days: int = 7, top: int = 15):
     hours = conn.execute("""
         SELECT strftime('%H', datetime(created_at, '+6 hours')) as h, COUNT(*) cnt
         FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
+        WHERE created_at >= ?
           AND COALESCE(user_agent,'') NOT LIKE '%bot%'
         GROUP BY h
         ORDER BY h
-    """, (f"-{days} days",)).fetchall()
+    """, (since,)).fetchall()
     hour_map = {h: c for h, c in hours}
     hour_series = [{"h": f"{i:02d}", "c": int(hour_map.get(f"{i:02d}", 0))} for i in range(24)]
-    hour_max = max([x["c"] for x in hour_series], default=1)
+    hour_max = max((x["c"] for x in hour_series), default=1)
 
     # TG форматы: tg->out по utm_content
     fmt_rows = conn.execute("""
-        WITH tg AS (
-          SELECT COALESCE(utm_content,'') fmt, COUNT(*) cnt
-          FROM clicks
-          WHERE src='tg' AND datetime(created_at) >= datetime('now', ?)
-          GROUP BY fmt
-        ),
-        out AS (
-          SELECT COALESCE(utm_content,'') fmt, COUNT(*) cnt
+        SELECT fmt, tg_clicks, out_clicks FROM (
+          SELECT COALESCE(utm_content,'') fmt,
+                 SUM(src='tg') tg_clicks,
+                 SUM(src='out') out_clicks
           FROM clicks
-          WHERE src='out' AND datetime(created_at) >= datetime('now', ?)
+          WHERE created_at >= ? AND src IN ('tg', 'out')
           GROUP BY fmt
         )
-        SELECT tg.fmt, tg.cnt tg_clicks, COALESCE(out.cnt,0) out_clicks
-        FROM tg
-        LEFT JOIN out ON out.fmt = tg.fmt
-        ORDER BY (1.0*COALESCE(out.cnt,0)/tg.cnt) DESC, tg_clicks DESC
+        WHERE tg_clicks > 0
+        ORDER BY (1.0*out_clicks/tg_clicks) DESC, tg_clicks DESC
         LIMIT 12
-    """, (f"-{days} days", f"-{days} days")).fetchall()
+    """, (since,)).fetchall()
 
     formats = []
     for fmt, tg_clicks, out_clicks in fmt_rows:
@@ -5012,29 +5127,32 @@ def stats_html(days: int = 7, top: int = 15):
             "conv": round(conv, 3)
         })
 
+    # pct для полосок считает сам SQLite (оконный MAX по всем дням)
     series = conn.execute("""
-        SELECT substr(created_at, 1, 10) as day, COUNT(*) as cnt
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-        GROUP BY day
+        SELECT day, cnt,
+               cnt * 100 / MAX(cnt) OVER () as pct
+        FROM clicks_daily
+        WHERE day >= ?
         ORDER BY day ASC
-    """, (f"-{days} days",)).fetchall()
+    """, (since[:10],)).fetchall()
 
     rows = conn.execute("""
-        SELECT c.deal_id, COUNT(*) as cnt, d.title, d.store
-        FROM clicks c
-        LEFT JOIN deals d ON d.id = c.deal_id
-        WHERE datetime(c.created_at) >= datetime('now', ?)
-            AND c.src = 'out'
-        GROUP BY c.deal_id
-        ORDER BY cnt DESC
-        LIMIT ?
-    """, (f"-{days} days", top)).fetchall()
+        SELECT t.deal_id, t.cnt, d.title, d.store
+        FROM (
+          SELECT deal_id, SUM(cnt) as cnt
+          FROM clicks_by_deal_day
+          WHERE src = 'out' AND day >= ?
+          GROUP BY deal_id
+          ORDER BY cnt DESC
+          LIMIT ?
+        ) t
+        LEFT JOIN deals d ON d.id = t.deal_id
+        ORDER BY t.cnt DESC
+    """, (since[:10], top)).fetchall()
 
     conn.close()
 
-    max_cnt = max([c for _, c in series], default=1)
-    daily = [{"day": d, "clicks": c, "pct": int((c / max_cnt) * 100)} for d, c in series]
+    daily = [{"day": d, "clicks": c, "pct": pct} for d, c, pct in series]
 
     top_items = [{
         "title": (title or "(не найдено)"),
@@ -5059,8 +5177,23 @@ def stats_html(days: int = 7, top: int = 15):
     )
 
 
+# дашборды дёргают /stats и /stats_funnel каждые несколько секунд,
+# а клики за это время почти не меняются — отдаём агрегаты из памяти
+STATS_CACHE_TTL = 30
+FUNNEL_CACHE_TTL = 60
+# значение: (время расчёта, готовый ответ)
+_STATS_CACHE: dict[tuple, tuple[float, dict]] = {}
+
+
+def stats_cache_get(key: tuple, ttl: int) -> dict | None:
+    hit = _STATS_CACHE.get(key)
+    if hit and time.time() - hit[0] < ttl:
+        return hit[1]
+    return None
+
+
 @app.get("/stats")
-def stats(days: int = 7, top: int = 15):
+def stats(days: int = 7, top: int = 15, nocache: int = 0):
     # days=7 по умолчанию; можно /stats?days=1 для суток
     if days < 1:
         days = 1
@@ -5071,67 +5204,67 @@ def stats(days: int = 7, top: int = 15):
     if top > 50:
         top = 50
 
-    conn = db()
+    # ?nocache=1 — посчитать заново (отладка после /backfill и т.п.)
+    cache_key = ("stats", days, top)
+    if not nocache:
+        hit = stats_cache_get(cache_key, STATS_CACHE_TTL)
+        if hit is not None:
+            return hit
 
-    # всего кликов за N дней
-    total = conn.execute("""
-        SELECT COUNT(*)
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-    """, (f"-{days} days",)).fetchone()[0]
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    day_ago = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    conn = db_read()
 
-    # клики за последние 24 часа (отдельно)
-    day_total = conn.execute("""
-        SELECT COUNT(*)
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', '-1 day')
-    """).fetchone()[0]
+    # всего кликов за N дней и за последние 24 часа — один проход по индексу
+    total, day_total = conn.execute(CLICKS_TOTALS_SQL, (day_ago, since)).fetchone()
 
     # топ по deal_id за N дней + подтягиваем title/store
     rows = conn.execute("""
-        SELECT c.deal_id,
-               COUNT(*) as cnt,
-               d.title,
-               d.store,
-               d.kind
-        FROM clicks c
-        LEFT JOIN deals d ON d.id = c.deal_id
-        WHERE datetime(c.created_at) >= datetime('now', ?)
-        GROUP BY c.deal_id
-        ORDER BY cnt DESC
-        LIMIT ?
-    """, (f"-{days} days", top)).fetchall()
+        SELECT t.deal_id, t.cnt, d.title, d.store, d.kind
+        FROM (
+          SELECT deal_id, SUM(cnt) as cnt
+          FROM clicks_by_deal_day
+          WHERE day >= ?
+          GROUP BY deal_id
+          ORDER BY cnt DESC
+          LIMIT ?
+        ) t
+        LEFT JOIN deals d ON d.id = t.deal_id
+        ORDER BY t.cnt DESC
+    """, (since[:10], top))
+    # строки сразу в ответ — без промежуточного fetchall()
+    top_items = [
+        {
+            "deal_id": r["deal_id"],
+            "clicks": r["cnt"],
+            "title": r["title"] or "(не найдено в deals)",
+            "store": r["store"] or "",
+            "kind": r["kind"] or "",
+            "link": f"{SITE_BASE}/d/{r['deal_id']}",
+        }
+        for r in rows
+    ]
 
     # дневная динамика по дням (последние N дней)
     series = conn.execute("""
-        SELECT substr(created_at, 1, 10) as day,
-               COUNT(*) as cnt
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-        GROUP BY day
+        SELECT day, cnt
+        FROM clicks_daily
+        WHERE day >= ?
         ORDER BY day ASC
-    """, (f"-{days} days",)).fetchall()
+    """, (since[:10],))
+    daily = [{"day": r["day"], "clicks": r["cnt"]} for r in series]
 
     conn.close()
 
-    top_items = []
-    for deal_id, cnt, title, store, kind in rows:
-        top_items.append({
-            "deal_id": deal_id,
-            "clicks": cnt,
-            "title": title or "(не найдено в deals)",
-            "store": store or "",
-            "kind": kind or "",
-            "link": f"{SITE_BASE}/d/{deal_id}",
-        })
-
-    return {
+    result = {
         "range_days": days,
         "clicks_last_24h": day_total,
         "clicks_range_total": total,
-        "daily": [{"day": d, "clicks": c} for d, c in series],
+        "daily": daily,
         "top": top_items,
     }
+    _STATS_CACHE[cache_key] = (time.time(), result)
+    return result
 
 
 @app.get("/stats_hours")
@@ -5139,18 +5272,19 @@ def stats_hours(days: int = 7):
     if days < 1: days = 1
     if days > 90: days = 90
 
-    conn = db()
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = db_read()
 
-    # created_at у тебя UTC isoformat → используем datetime(created_at)
-    # Если хочешь по Бишкеку (+06), добавь '+6 hours'
+    # created_at у тебя UTC isoformat → сравниваем строки напрямую (индекс),
+    # datetime(created_at) только для вывода часа по Бишкеку (+06)
     rows = conn.execute("""
         SELECT strftime('%H', datetime(created_at, '+6 hours')) as hour, COUNT(*) cnt
         FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
+        WHERE created_at >= ?
           AND COALESCE(user_agent,'') NOT LIKE '%bot%'
         GROUP BY hour
         ORDER BY hour
-    """, (f"-{days} days",)).fetchall()
+    """, (since,)).fetchall()
 
     conn.close()
 
@@ -5166,16 +5300,17 @@ def stats_retention(days: int = 7):
     if days < 1: days = 1
     if days > 90: days = 90
 
-    conn = db()
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = db_read()
 
     # users that appeared in range
     total_users = conn.execute("""
         SELECT COUNT(DISTINCT visitor_id)
         FROM clicks
         WHERE visitor_id IS NOT NULL
-          AND datetime(created_at) >= datetime('now', ?)
+          AND created_at >= ?
           AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-    """, (f"-{days} days",)).fetchone()[0]
+    """, (since,)).fetchone()[0]
 
     # returning: had activity BEFORE range start
     returning = conn.execute("""
@@ -5183,7 +5318,7 @@ def stats_retention(days: int = 7):
           SELECT DISTINCT visitor_id
           FROM clicks
           WHERE visitor_id IS NOT NULL
-            AND datetime(created_at) >= datetime('now', ?)
+            AND created_at >= ?
             AND COALESCE(user_agent,'') NOT LIKE '%bot%'
         )
         SELECT COUNT(*)
@@ -5191,9 +5326,9 @@ def stats_retention(days: int = 7):
         WHERE EXISTS (
           SELECT 1 FROM clicks c
           WHERE c.visitor_id = r.visitor_id
-            AND datetime(c.created_at) < datetime('now', ?)
+            AND c.created_at < ?
         )
-    """, (f"-{days} days", f"-{days} days")).fetchone()[0]
+    """, (since, since)).fetchone()[0]
 
     new_users = max(total_users - returning, 0)
 
@@ -5208,8 +5343,8 @@ def stats_retention(days: int = 7):
 
 @app.get("/count")
 def count_rows():
-    conn = db()
-    total = conn.execute("SELECT COUNT(*) FROM deals").fetchone()[0]
+    conn = db_read()
+    total = conn.execute(COUNT_DEALS_SQL).fetchone()[0]
     conn.close()
     return {"total": total}
 
@@ -5223,11 +5358,41 @@ def backfill():
 def job_sync(store: str = "steam"):
     return asyncio.run(job_async(store=store))
 
-import subprocess
+# /update только ставит магазин в очередь; systemctl запускает update_worker,
+# повторные запросы того же магазина в пределах окна схлопываются
+UPDATE_STORES = frozenset({"steam", "epic", "gog", "prime"})  # есть freerg-update@<store>.service
+UPDATE_QUEUE: asyncio.Queue = asyncio.Queue(maxsize=16)
+UPDATE_DEBOUNCE_SEC = 30
+_LAST_UPDATE_KICK: dict[str, float] = {}
+_update_worker_task: asyncio.Task | None = None
+
+
+async def update_worker():
+    while True:
+        store = await UPDATE_QUEUE.get()
+        now = time.time()
+        if now - _LAST_UPDATE_KICK.get(store, 0) < UPDATE_DEBOUNCE_SEC:
+            continue
+        _LAST_UPDATE_KICK[store] = now
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "systemctl", "start", f"freerg-update@{store}.service"
+            )
+            await proc.wait()
+        except Exception as e:
+            print("UPDATE KICK ERROR:", store, repr(e))
+
 
 @app.get("/update")
 async def update_now(store: str = "steam"):
-    subprocess.Popen(["systemctl", "start", f"freerg-update@{store}.service"])
+    store = (store or "").strip().lower()
+    if store not in UPDATE_STORES:
+        return {"ok": False, "error": f"unknown store: {store[:32]}"}
+    try:
+        UPDATE_QUEUE.put_nowait(store)
+    except asyncio.QueueFull:
+        # очередь забита повторами — их всё равно схлопнул бы debounce
+        return {"ok": True, "queued": False, "store": store}
     return {"ok": True, "queued": True, "store": store}
 
 
@@ -5244,12 +5409,14 @@ async def post_last(n: int = 1):
     """
     Форс-пост последних N (для тестов): помечаем posted=0 и отправляем.
     """
-    conn = db()
-    ids = conn.execute("SELECT id FROM deals ORDER BY created_at DESC LIMIT ?", (n,)).fetchall()
-    for (did,) in ids:
-        conn.execute("UPDATE deals SET posted=0 WHERE id=?", (did,))
-    conn.commit()
-    conn.close()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE deals SET posted=0 WHERE id IN "
+            "(SELECT id FROM deals ORDER BY created_at DESC LIMIT ?)",
+            (n,),
+        )
+        conn.commit()
 
     tg = await post_unposted_to_telegram(limit=n)
     return {"ok": True, "result": tg}
@@ -5285,12 +5452,6 @@ def cleanup(keep_days: int = 7):
 # --------------------
 # Startup / Shutdown
 # --------------------
-def run_job(store: str):
-    # APScheduler вызывает обычную функцию (sync),
-    # поэтому запускаем async-джоб через asyncio.run()
-    asyncio.run(job_async(store=store))
-
-
 # ==========================================
 # 🛡️ АДМИН-ПАНЕЛЬ
 # ==========================================
@@ -5697,6 +5858,7 @@ def admin_delete_lfg(lfg_id: str, request: Request):
     conn = db()
     conn.execute("DELETE FROM lfg WHERE id=?", (lfg_id,))
     conn.commit()
+    invalidate_page_cache()
     conn.close()
     
     return {"ok": True}
@@ -5715,6 +5877,7 @@ def admin_cleanup(request: Request):
         WHERE expires_at < ?
     """, (datetime.utcnow().isoformat(),)).rowcount
     conn.commit()
+    invalidate_page_cache()
     conn.close()
     
     return {"ok": True, "deleted": deleted}
@@ -5724,7 +5887,7 @@ def admin_cleanup(request: Request):
 
 @app.on_event("startup")
 async def on_startup():
-    global _scheduler_started
+    global _scheduler_started, _click_writer_task, _update_worker_task
 
     # 1) Миграции схемы БД (обязательно!)
     try:
@@ -5742,6 +5905,26 @@ async def on_startup():
         # можно не падать, но я бы пока поднимал ошибку
         raise
 
+    # 2.1) Флаги is_new / is_expired_recent (дальше обновляет cron)
+    try:
+        refresh_deal_flags()
+    except Exception as e:
+        print("STARTUP FLAGS ERROR:", repr(e))
+
+    # 2.1.1) Прогрев кэша карточек /d/
+    try:
+        warm_deal_meta()
+    except Exception as e:
+        print("STARTUP WARM ERROR:", repr(e))
+
+    # 2.2) Фоновая запись кликов /go
+    if _click_writer_task is None:
+        _click_writer_task = asyncio.create_task(click_writer())
+
+    # 2.3) Запуск обновлений по /update
+    if _update_worker_task is None:
+        _update_worker_task = asyncio.create_task(update_worker())
+
     # 3) Защита от двойного старта (reload/несколько воркеров)
     if _scheduler_started:
         return
@@ -5750,10 +5933,14 @@ async def on_startup():
         if not scheduler.get_job(job_id):
             scheduler.add_job(*args, id=job_id, replace_existing=True, **kwargs)
 
+    # job_async — корутина: AsyncIOScheduler запускает её прямо в цикле приложения
+    # (те же JOB_LOCKS и TG-клиент), не занимая поток default executor'а,
+    # который нужен самим джобам под asyncio.to_thread
+
     # Steam — каждые STEAM_MIN минут
     add_once(
         "steam_job",
-        run_job,
+        job_async,
         "interval",
         minutes=STEAM_MIN,
         kwargs={"store": "steam"},
@@ -5767,7 +5954,7 @@ async def on_startup():
 
     add_once(
         "epic_job",
-        run_job,
+        job_async,
         trigger=daily,
         kwargs={"store": "epic"},
         coalesce=True,
@@ -5777,7 +5964,7 @@ async def on_startup():
 
     add_once(
         "gog_job",
-        run_job,
+        job_async,
         trigger=daily,
         kwargs={"store": "gog"},
         coalesce=True,
@@ -5787,7 +5974,7 @@ async def on_startup():
 
     add_once(
         "prime_job",
-        run_job,
+        job_async,
         trigger=daily,
         kwargs={"store": "prime"},
         coalesce=True,
@@ -5807,6 +5994,16 @@ async def on_startup():
         misfire_grace_time=60 * 60,
     )
 
+    # Флаги NEW / недавно истёкших — каждый час в :05
+    add_once(
+        "flags_job",
+        refresh_deal_flags,
+        trigger=CronTrigger(minute=5, timezone=BISHKEK_TZ),
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=60 * 30,
+    )
+
     if not scheduler.running:
         scheduler.start()
 
@@ -5876,10 +6073,25 @@ def api_vote(payload: VoteIn, request: Request):
         resp.set_cookie(VOTE_COOKIE_NAME, vid, max_age=31536000, httponly=True, samesite="Lax")
     return resp
 
+DEBUG_IMAGES_WORKERS = 16
+DEBUG_IMAGE_CANDIDATES = (
+    "https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{appid}/header.jpg",
+    "https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/header.jpg",
+    "https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/capsule_616x353.jpg",
+)
+
+
+def probe_image_url(url: str) -> bool:
+    try:
+        return SESSION.head(url, timeout=2, allow_redirects=False).status_code == 200
+    except Exception:
+        return False
+
+
 @app.get("/debug_images")
 def debug_images(limit: int = 5):
     """Отладочная информация по изображениям"""
-    conn = db()
+    conn = db_read()
     
     # Получаем Steam игры
     rows = conn.execute("""
@@ -5889,52 +6101,31 @@ def debug_images(limit: int = 5):
         ORDER BY created_at DESC 
         LIMIT ?
     """, (limit,)).fetchall()
+    conn.close()
     
-    result = []
-    for did, store, title, url, image_url in rows:
-        appid = extract_steam_app_id_fast(url)
-        
-        # Проверяем доступность image_url
-        image_ok = False
-        if image_url:
-            try:
-                resp = requests.head(image_url, timeout=3)
-                image_ok = resp.status_code == 200
-            except:
-                pass
-        
-        # Генерируем кандидаты
-        candidates = []
-        if appid:
-            candidates = [
-                f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{appid}/header.jpg",
-                f"https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/header.jpg",
-                f"https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/capsule_616x353.jpg",
-            ]
-        
-        # Проверяем кандидатов
-        working_candidates = []
-        for cand in candidates:
-            try:
-                resp = requests.head(cand, timeout=2)
-                if resp.status_code == 200:
-                    working_candidates.append(cand)
-            except:
-                pass
-        
-        result.append({
+    # Генерируем кандидатов: app_id для всех строк разом, потом URL по шаблонам
+    appids = [extract_steam_app_id_fast(r[3]) for r in rows]
+    cands = [[t.format(appid=a) for t in DEBUG_IMAGE_CANDIDATES] if a else [] for a in appids]
+    
+    # Все HEAD-проверки — одним пулом и без повторов одинаковых URL
+    urls = list({r[4] for r in rows if r[4]}.union(*cands))
+    with ThreadPoolExecutor(max_workers=DEBUG_IMAGES_WORKERS) as pool:
+        ok = dict(zip(urls, pool.map(probe_image_url, urls)))
+    
+    result = [
+        {
             "id": did,
             "store": store,
             "title": title[:50],
             "url": url,
             "appid": appid,
             "image_in_db": image_url,
-            "image_ok": image_ok,
+            "image_ok": bool(image_url) and ok[image_url],
             "candidates": candidates,
-            "working_candidates": working_candidates,
-        })
-    
-    conn.close()
+            "working_candidates": [c for c in candidates if ok[c]],
+        }
+        for (did, store, title, url, image_url), appid, candidates in zip(rows, appids, cands)
+    ]
     
     return {
         "total": len(result),
@@ -5947,93 +6138,92 @@ def debug_images(limit: int = 5):
     }
 
 @app.get("/stats_funnel")
-def stats_funnel(days: int = 7, top: int = 15):
+def stats_funnel(days: int = 7, top: int = 15, nocache: int = 0):
     if days < 1: days = 1
     if days > 90: days = 90
     if top < 1: top = 1
     if top > 50: top = 50
 
-    conn = db()
+    cache_key = ("funnel", days, top)
+    if not nocache:
+        hit = stats_cache_get(cache_key, FUNNEL_CACHE_TTL)
+        if hit is not None:
+            return hit
+
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = db_read()
 
     # клики по источникам
     by_src = conn.execute("""
-        SELECT COALESCE(src,'') as src, COUNT(*) as cnt
-        FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
+        SELECT src, SUM(cnt) as cnt
+        FROM clicks_by_deal_day
+        WHERE day >= ?
         GROUP BY src
         ORDER BY cnt DESC
-    """, (f"-{days} days",)).fetchall()
+    """, (since[:10],))
+    funnel = [{"src": r["src"], "clicks": r["cnt"]} for r in by_src]
 
     # топ по "конверсии": out / tg
+    # tg и out одним проходом — условная агрегация вместо двух CTE
     rows = conn.execute("""
-        WITH tg AS (
-          SELECT deal_id, COUNT(*) cnt
-          FROM clicks
-          WHERE src='tg' AND datetime(created_at) >= datetime('now', ?)
-          GROUP BY deal_id
-        ),
-        out AS (
-          SELECT deal_id, COUNT(*) cnt
-          FROM clicks
-          WHERE src='out' AND datetime(created_at) >= datetime('now', ?)
+        WITH agg AS (
+          SELECT deal_id,
+                 SUM(CASE WHEN src='tg' THEN cnt ELSE 0 END) as tg_cnt,
+                 SUM(CASE WHEN src='out' THEN cnt ELSE 0 END) as out_cnt
+          FROM clicks_by_deal_day
+          WHERE day >= ? AND src IN ('tg', 'out')
           GROUP BY deal_id
         )
         SELECT d.id, d.title, d.store,
-               COALESCE(tg.cnt,0) as tg_clicks,
-               COALESCE(out.cnt,0) as out_clicks
-        FROM deals d
-        LEFT JOIN tg ON tg.deal_id = d.id
-        LEFT JOIN out ON out.deal_id = d.id
-        WHERE COALESCE(tg.cnt,0) > 0
-        ORDER BY (1.0*COALESCE(out.cnt,0)/tg.cnt) DESC, tg_clicks DESC
+               agg.tg_cnt as tg_clicks,
+               agg.out_cnt as out_clicks
+        FROM agg
+        JOIN deals d ON d.id = agg.deal_id
+        WHERE agg.tg_cnt > 0
+        ORDER BY (1.0*agg.out_cnt/agg.tg_cnt) DESC, agg.tg_cnt DESC
         LIMIT ?
-    """, (f"-{days} days", f"-{days} days", top)).fetchall()
+    """, (since[:10], top))
 
-    conn.close()
-
-    funnel = [{"src": s, "clicks": c} for s, c in by_src]
     top_conv = []
-    for did, title, store, tg_clicks, out_clicks in rows:
+    for r in rows:
+        tg_clicks, out_clicks = r["tg_clicks"], r["out_clicks"]
         conv = (out_clicks / tg_clicks) if tg_clicks else 0.0
         top_conv.append({
-            "deal_id": did,
-            "title": title or "(no title)",
-            "store": store or "",
+            "deal_id": r["id"],
+            "title": r["title"] or "(no title)",
+            "store": r["store"] or "",
             "tg_clicks": tg_clicks,
             "out_clicks": out_clicks,
             "conv_tg_to_store": round(conv, 3),
-            "link": f"{SITE_BASE}/d/{did}",
+            "link": f"{SITE_BASE}/d/{r['id']}",
         })
 
-    return {"range_days": days, "by_src": funnel, "top_conversion": top_conv}
+    conn.close()
+
+    result = {"range_days": days, "by_src": funnel, "top_conversion": top_conv}
+    _STATS_CACHE[cache_key] = (time.time(), result)
+    return result
 
 @app.get("/stats_tg_formats")
 def stats_tg_formats(days: int = 7):
     if days < 1: days = 1
     if days > 90: days = 90
 
-    conn = db()
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = db_read()
 
     rows = conn.execute("""
-        WITH tg AS (
-          SELECT COALESCE(utm_content,'') as fmt, COUNT(*) cnt
-          FROM clicks
-          WHERE src='tg' AND datetime(created_at) >= datetime('now', ?)
-          GROUP BY fmt
-        ),
-        out AS (
-          SELECT COALESCE(utm_content,'') as fmt, COUNT(*) cnt
+        SELECT fmt, tg_clicks, out_clicks FROM (
+          SELECT COALESCE(utm_content,'') as fmt,
+                 SUM(src='tg') as tg_clicks,
+                 SUM(src='out') as out_clicks
           FROM clicks
-          WHERE src='out' AND datetime(created_at) >= datetime('now', ?)
+          WHERE created_at >= ? AND src IN ('tg', 'out')
           GROUP BY fmt
         )
-        SELECT tg.fmt,
-               tg.cnt as tg_clicks,
-               COALESCE(out.cnt,0) as out_clicks
-        FROM tg
-        LEFT JOIN out ON out.fmt = tg.fmt
-        ORDER BY (1.0*COALESCE(out.cnt,0)/tg.cnt) DESC, tg_clicks DESC
-    """, (f"-{days} days", f"-{days} days")).fetchall()
+        WHERE tg_clicks > 0
+        ORDER BY (1.0*out_clicks/tg_clicks) DESC, tg_clicks DESC
+    """, (since,)).fetchall()
 
     conn.close()
 
@@ -6056,22 +6246,23 @@ def stats_live(minutes: int = 60):
     if minutes < 5: minutes = 5
     if minutes > 24*60: minutes = 24*60
 
-    conn = db()
+    since = (datetime.utcnow() - timedelta(minutes=minutes)).isoformat()
+    conn = db_read()
 
     # кликов за последние N минут
     clicks = conn.execute("""
         SELECT COUNT(*)
         FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
-    """, (f"-{minutes} minutes",)).fetchone()[0]
+        WHERE created_at >= ?
+    """, (since,)).fetchone()[0]
 
     # уникальные IP (не идеал, но достаточно для лайва)
     uniq_ip = conn.execute("""
         SELECT COUNT(DISTINCT ip)
         FROM clicks
-        WHERE datetime(created_at) >= datetime('now', ?)
+        WHERE created_at >= ?
           AND COALESCE(user_agent,'') NOT LIKE '%bot%'
-    """, (f"-{minutes} minutes",)).fetchone()[0]
+    """, (since,)).fetchone()[0]
 
     # последние 10 кликов
     last = conn.execute("""
@@ -6169,17 +6360,18 @@ def dashboard():
 from fastapi.responses import RedirectResponse
 
 @app.get("/out/{deal_id}")
-def out(deal_id: str, request: Request):
-    conn = db()
-
-    row = conn.execute("SELECT url FROM deals WHERE id=? LIMIT 1", (deal_id,)).fetchone()
-    out_url = row[0] if row and row[0] else "/"
+async def out(deal_id: str, request: Request):
+    # deal_meta — LRU по id (сбрасывается в invalidate_page_cache): когда
+    # раздача уже в кэше, редирект вообще не трогает БД; промах — SQLite в потоке,
+    # цикл событий не ждёт
+    meta = deal_meta_cached(deal_id) or await asyncio.to_thread(deal_meta, deal_id)
+    out_url = (meta[3] if meta else None) or "/"
 
     resp = RedirectResponse(url=out_url, status_code=302)
     vid = get_or_set_vid(request, resp)
-    log_click(conn, deal_id, request, src="out", visitor_id=vid)
 
-    conn.close()
+    # редирект не ждёт записи — клик заберёт click_writer (см. CLICK_QUEUE)
+    CLICK_QUEUE.put_nowait(click_row(deal_id, request, src="out", visitor_id=vid))
     return resp
 
 
@@ -6253,14 +6445,29 @@ def service_worker():
 
 @app.get("/debug_hot")
 def debug_hot():
-    conn = db()
-    total = conn.execute("SELECT COUNT(*) FROM deals WHERE kind='hot_deal'").fetchone()[0]
-    sample = conn.execute("SELECT id, store, title, discount_pct FROM deals WHERE kind='hot_deal' LIMIT 5").fetchall()
+    conn = db_read()
+    total = conn.execute(HOT_COUNT_SQL).fetchone()[0]
+    sample = conn.execute(HOT_SAMPLE_SQL).fetchall()
     conn.close()
     return {"total_hot_deal": total, "sample": sample}
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    if _update_worker_task is not None:
+        _update_worker_task.cancel()
+
+    # дописываем клики, которые writer ещё не успел сбросить
+    if _click_writer_task is not None:
+        _click_writer_task.cancel()
+    pending = []
+    while not CLICK_QUEUE.empty():
+        pending.append(CLICK_QUEUE.get_nowait())
+    if pending:
+        try:
+            write_clicks(pending)
+        except Exception as e:
+            print("CLICK FLUSH ERROR:", repr(e))
+
     try:
         if scheduler.running:
             scheduler.shutdown(wait=False)
@@ -0,0 +1,109 @@
+// 🚀 Кнопка "Наверх"
+const scrollBtn = document.getElementById('scrollToTop');
+
+// Показываем кнопку при прокрутке вниз
+window.addEventListener('scroll', function() {
+    if (window.pageYOffset > 300) {
+        scrollBtn.classList.add('show');
+    } else {
+        scrollBtn.classList.remove('show');
+    }
+});
+
+// Плавная прокрутка наверх
+function scrollToTop() {
+    window.scrollTo({
+        top: 0,
+        behavior: 'smooth'
+    });
+}
+
+(function(){
+  const header = document.querySelector(".header");
+  const btn = document.getElementById("collapseBtn");
+  if(!header) return;
+
+  let lastY = window.scrollY;
+  let ticking = false;
+
+  function applyPadding(){
+    // ✅ padding всегда равен высоте header (даже когда hidden)
+    // иначе появляются "прыжки" и "пустота"
+    document.body.style.paddingTop = header.offsetHeight + "px";
+  }
+
+  // старт / resize
+  applyPadding();
+  window.addEventListener("resize", () => requestAnimationFrame(applyPadding));
+
+  // collapse toggle
+  if(btn){
+    btn.addEventListener("click", () => {
+      header.classList.toggle("collapsed");
+      btn.textContent = header.classList.contains("collapsed") ? "Фильтры ▼" : "Свернуть ▲";
+      requestAnimationFrame(applyPadding);
+    });
+  }
+
+  function onScroll(){
+    const y = window.scrollY;
+
+    // верх страницы — всегда показываем
+    if (y < 30){
+      header.classList.remove("hidden");
+      lastY = y;
+      return;
+    }
+
+    // вниз — прячем, вверх — показываем
+    if (y > lastY + 12){
+      header.classList.add("hidden");
+    } else if (y < lastY - 12){
+      header.classList.remove("hidden");
+    }
+
+    lastY = y;
+  }
+
+  window.addEventListener("scroll", () => {
+    if(!ticking){
+      requestAnimationFrame(() => {
+        onScroll();
+        ticking = false;
+      });
+      ticking = true;
+    }
+  }, { passive:true });
+
+  // если шрифт/контент в header догрузился и высота изменилась
+  setTimeout(applyPadding, 200);
+})();
+
+// HTML главной кэшируется (сервер + браузер), а дедлайны идут дальше:
+// таймеры с уже прошедшим data-ends прячем на клиенте
+(function(){
+  function hideExpiredTimers(){
+    const now = Date.now();
+    document.querySelectorAll(".game-timer[data-ends]").forEach((el) => {
+      const t = Date.parse(el.dataset.ends);
+      if (!isNaN(t) && t <= now) el.hidden = true;
+    });
+  }
+  hideExpiredTimers();
+  setInterval(hideExpiredTimers, 60 * 1000);
+})();
+
+// то же для бейджа NEW: сервер ставит его по флагу is_new, а закэшированный HTML
+// живёт дольше суток — бейдж старше NEW_MS (как new_hours в refresh_deal_flags) убираем
+(function(){
+  const NEW_MS = 24 * 60 * 60 * 1000;
+  function hideStaleNew(){
+    const now = Date.now();
+    document.querySelectorAll(".tag-new[data-created]").forEach((el) => {
+      const t = Date.parse(el.dataset.created);
+      if (!isNaN(t) && now - t >= NEW_MS) el.remove();
+    });
+  }
+  hideStaleNew();
+  setInterval(hideStaleNew, 60 * 1000);
+})();
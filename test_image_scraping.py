@@ -2,8 +2,14 @@
 """
 Тестируем получение изображений Steam в новом формате
 """
-import requests
+import io
+import json
+import os
 import re
+from pathlib import Path
+
+import pytest
+import requests
 
 
 def get_steam_images_from_page_new(app_id: str):
@@ -94,6 +100,75 @@ def test_new_steam_images():
             print(f"   https://store.steampowered.com/app/{app_id}/")
 
 
+# --------------------
+# Разбор ответа ITAD и If-None-Match (без сети)
+# --------------------
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    """app.py целиком: при импорте монтирует static и знает путь к БД — подставляем свои."""
+    os.environ.setdefault("STATIC_DIR", str(Path(__file__).parent / "static"))
+    os.environ.setdefault("DB_PATH", str(tmp_path_factory.mktemp("db") / "data.sqlite3"))
+    return pytest.importorskip("app")
+
+
+class _Raw(io.BytesIO):
+    """r.raw: файловый объект, которому itad_stream_items ставит decode_content."""
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode("utf-8")
+        self.raw = _Raw(self.content)
+
+
+ITAD_ITEMS = [
+    {"title": "Game A", "deal": {"cut": 90, "price": {"amount": 1.99, "currency": "USD"}}},
+    {"title": "Game B", "deal": {"cut": 75, "price": {"amount": 0, "currency": "USD"}}},
+]
+
+ITAD_SHAPES = {
+    "bare_list": ITAD_ITEMS,
+    "list": {"nextOffset": 2, "hasMore": False, "list": ITAD_ITEMS},
+    "data": {"data": ITAD_ITEMS},
+}
+
+
+@pytest.mark.parametrize("shape", sorted(ITAD_SHAPES))
+def test_itad_stream_items_ijson(app_module, shape):
+    """Потоковый разбор понимает те же формы ответа, что и json_loads-фоллбэк."""
+    if app_module.ijson is None:
+        pytest.skip("ijson не установлен")
+    items = list(app_module.itad_stream_items(FakeResponse(ITAD_SHAPES[shape])))
+    assert items == ITAD_ITEMS
+    # use_float: цены — float, а не Decimal (sqlite Decimal не биндит)
+    assert isinstance(items[0]["deal"]["price"]["amount"], float)
+
+
+@pytest.mark.parametrize("shape", sorted(ITAD_SHAPES))
+def test_itad_stream_items_fallback(app_module, monkeypatch, shape):
+    """Без ijson ответ читается целиком через json_loads."""
+    monkeypatch.setattr(app_module, "ijson", None)
+    assert list(app_module.itad_stream_items(FakeResponse(ITAD_SHAPES[shape]))) == ITAD_ITEMS
+
+
+ETAG = 'W/"0123456789abcdef"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    (ETAG, True),
+    ('"0123456789abcdef"', True),           # слабое сравнение: W/ не важен
+    ('"other", W/"0123456789abcdef"', True),  # список через запятую
+    ('W/"other" ,  "0123456789abcdef" ', True),
+    ('"other", W/"another"', False),
+    ('W/"0123456789abcde"', False),
+])
+def test_etag_matches(app_module, header, expected):
+    assert app_module.etag_matches(header, ETAG) is expected
+
+
 if __name__ == "__main__":
     print("🔍 Тестирование извлечения изображений Steam")
     print("=" * 60)